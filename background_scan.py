@@ -0,0 +1,335 @@
+"""Background File System Scans
+
+=== Module Description ===
+This module contains BackgroundScan, which builds a FileSystemTree in a
+separate thread, so that the visualiser can keep drawing and responding to
+the user while a large folder is scanned.
+
+While the scan runs, it regularly publishes a preview: a coarse copy of the
+part of the tree that has been scanned so far. Folders in the preview are
+only copied PREVIEW_DEPTH levels deep; deeper folders appear as single
+leaves holding their total size. Only the PREVIEW_CHILDREN largest items in
+each folder are copied, and the rest are shown as a single OTHER_NAME leaf
+holding their total size, so the cost of a preview does not grow with the
+number of files scanned so far. Each preview is a new, independent tree,
+so the visualiser can use it without any locking. When the scan is
+finished, the complete tree is published, and saved to a snapshot file if
+one was requested.
+
+Previews are built on the scanning thread, so the time between previews
+grows with the time the last one took, to keep them from slowing the scan
+down.
+"""
+import heapq
+import threading
+import time
+
+from tree_data import FileSystemTree
+from search import SearchIndex
+from profiling import PROFILER
+from scanner import OTHER_NAME
+from snapshot import save_snapshot
+
+
+# The minimum time between previews, in seconds.
+PREVIEW_INTERVAL = 0.25
+# The time between previews is at least this many times the time taken by
+# the last one.
+PREVIEW_BACKOFF = 10
+# The number of levels of the tree that are copied into a preview.
+PREVIEW_DEPTH = 4
+# The number of items in each folder that are copied into a preview.
+PREVIEW_CHILDREN = 16
+
+
+def _copy_subtrees(subtrees, depth):
+    """Return copies of the PREVIEW_CHILDREN largest trees in <subtrees>,
+    each at most <depth> levels deep, followed by an OTHER_NAME leaf holding
+    the total size of the rest, if there are any.
+
+    @type subtrees: list[FileSystemTree]
+    @type depth: int
+    @rtype: list[FileSystemTree]
+    """
+    if len(subtrees) <= PREVIEW_CHILDREN:
+        return [_copy_tree(subtree, depth) for subtree in subtrees]
+    largest = heapq.nlargest(PREVIEW_CHILDREN, subtrees,
+                             key=lambda subtree: subtree.data_size)
+    copies = [_copy_tree(subtree, depth) for subtree in largest]
+    other_size = sum(subtree.data_size for subtree in subtrees) - \
+        sum(subtree.data_size for subtree in largest)
+    copies.append(FileSystemTree._from_scan(OTHER_NAME, [], other_size))
+    return copies
+
+
+def _copy_tree(tree, depth):
+    """Return a copy of <tree> that is at most <depth> levels deep.
+
+    Subtrees at the last level are copied as leaves with the same data_size,
+    and each folder is copied as in _copy_subtrees.
+
+    @type tree: FileSystemTree
+    @type depth: int
+    @rtype: FileSystemTree
+    """
+    if depth <= 1:
+        subtrees = []
+    else:
+        subtrees = _copy_subtrees(tree._subtrees, depth - 1)
+    return FileSystemTree._from_scan(tree._root, subtrees, tree.data_size)
+
+
+def _count_items(tree):
+    """Return the number of files and folders in <tree>, including itself.
+
+    @type tree: FileSystemTree
+    @rtype: int
+    """
+    count = 0
+    stack = [tree]
+    while stack:
+        count += 1
+        stack.extend(stack.pop()._subtrees)
+    return count
+
+
+class BackgroundScan:
+    """A FileSystemTree that is being built in a background thread.
+
+    === Public Attributes ===
+    @type path: str
+        The path that is being scanned.
+    @type entries: int
+        The number of entries scanned so far, updated every
+        tree_data.PROGRESS_ENTRIES entries. Once the scan has finished
+        successfully, the number of files and folders in the tree.
+    @type done: bool
+        Whether the scan has finished.
+    @type tree: FileSystemTree | None
+        The complete tree, once the scan has finished successfully.
+    @type search_index: SearchIndex
+        The index of the files in the tree. It is only complete once the
+        scan has finished.
+    @type error: Exception | None
+        The error that stopped the scan, if any.
+    @type snapshot_path: str | None
+        The path that the complete tree is saved to as a snapshot, if any.
+    @type snapshot_error: Exception | None
+        The error that stopped the snapshot from being saved, if any.
+
+    === Private Attributes ===
+    @type _options: ScanOptions | None
+        The options used for the scan.
+    @type _lock: threading.Lock
+        Protects _latest and _version.
+    @type _latest: FileSystemTree | None
+        The most recently published tree.
+    @type _version: int
+        The number of trees published so far.
+    @type _last_preview: float
+        The time at which the last preview was published.
+    @type _interval: float
+        The minimum time until the next preview, in seconds.
+    @type _thread: threading.Thread
+        The thread that runs the scan.
+
+    >>> import os
+    >>> import shutil
+    >>> import tempfile
+    >>> import background_scan
+    >>> import tree_data
+    >>> folder = tempfile.mkdtemp()
+    >>> for i in range(6):
+    ...     os.makedirs(os.path.join(folder, 'd{}'.format(i), 'e'))
+    ...     for j in range(5):
+    ...         name = os.path.join(folder, 'd{}'.format(i), 'e',
+    ...                             'f{}'.format(j))
+    ...         with open(name, 'wb') as f:
+    ...             _ = f.write(b'x' * (i + j + 1))
+    >>> saved = (tree_data.PROGRESS_ENTRIES, background_scan.PREVIEW_INTERVAL,
+    ...          background_scan.PREVIEW_BACKOFF,
+    ...          background_scan.PREVIEW_CHILDREN)
+    >>> tree_data.PROGRESS_ENTRIES = 4
+    >>> background_scan.PREVIEW_INTERVAL = 0
+    >>> background_scan.PREVIEW_BACKOFF = 0
+    >>> background_scan.PREVIEW_CHILDREN = 3
+    >>> published = []
+    >>> class RecordingScan(BackgroundScan):
+    ...     def _publish(self, tree):
+    ...         published.append(tree)
+    ...         BackgroundScan._publish(self, tree)
+    >>> def adds_up(tree):
+    ...     return len(tree._subtrees) == 0 or (
+    ...         tree.data_size == sum(t.data_size for t in tree._subtrees)
+    ...         and all(adds_up(subtree) for subtree in tree._subtrees))
+    >>> def shape(tree):
+    ...     return (tree._root, tree.data_size,
+    ...             sorted(shape(subtree) for subtree in tree._subtrees))
+    >>> scan = RecordingScan(folder)
+    >>> scan.start()
+    >>> scan._thread.join()
+    >>> scan.done, scan.error, scan.entries
+    (True, None, 43)
+    >>> len(published)
+    15
+
+    Each folder in a preview has at most PREVIEW_CHILDREN of its items,
+    plus '<other>' for the rest and the folder being scanned:
+
+    >>> all(adds_up(tree) for tree in published)
+    True
+    >>> max(len(tree._subtrees) for tree in published[:-1])
+    5
+    >>> '<other>' in [subtree._root for subtree in published[-2]._subtrees]
+    True
+    >>> shape(scan.tree) == shape(FileSystemTree(folder))
+    True
+    >>> scan.poll(0)[0] is scan.tree
+    True
+    >>> len(scan.search_index)
+    30
+
+    Errors of any kind end the scan, and are reported in error:
+
+    >>> scan = BackgroundScan(os.path.join(folder, 'missing'))
+    >>> scan.start()
+    >>> scan._thread.join()
+    >>> scan.done, type(scan.error)
+    (True, <class 'FileNotFoundError'>)
+    >>> scan = BackgroundScan(folder, options='not options')
+    >>> scan.start()
+    >>> scan._thread.join()
+    >>> scan.done, type(scan.error)
+    (True, <class 'AttributeError'>)
+    >>> (tree_data.PROGRESS_ENTRIES, background_scan.PREVIEW_INTERVAL,
+    ...  background_scan.PREVIEW_BACKOFF,
+    ...  background_scan.PREVIEW_CHILDREN) = saved
+    >>> shutil.rmtree(folder)
+    """
+    def __init__(self, path, options=None, snapshot_path=None):
+        """Initialize a new BackgroundScan of <path>. The scan does not begin
+        until start is called.
+
+        @type self: BackgroundScan
+        @type path: str
+        @type options: ScanOptions | None
+        @type snapshot_path: str | None
+        @rtype: None
+        """
+        self.path = path
+        self.entries = 0
+        self.done = False
+        self.tree = None
+        self.search_index = SearchIndex()
+        self.error = None
+        self.snapshot_path = snapshot_path
+        self.snapshot_error = None
+        self._options = options
+        self._lock = threading.Lock()
+        self._latest = None
+        self._version = 0
+        self._last_preview = 0.0
+        self._interval = PREVIEW_INTERVAL
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """Start scanning in the background.
+
+        @type self: BackgroundScan
+        @rtype: None
+        """
+        self._last_preview = time.perf_counter()
+        self._thread.start()
+
+    def _run(self):
+        """Scan the path, publish the complete tree, and save it if
+        snapshot_path is set.
+
+        This runs in the background thread. Whatever happens, done is set
+        when it returns, and any exception is stored in error (or
+        snapshot_error) for the visualiser to report, rather than ending the
+        thread.
+
+        @type self: BackgroundScan
+        @rtype: None
+        """
+        try:
+            with PROFILER.phase('scan'):
+                tree = FileSystemTree(self.path, self.search_index,
+                                      self._options, self._preview)
+            self.entries = _count_items(tree)
+            self.tree = tree
+            self._publish(tree)
+            if self.snapshot_path is not None:
+                try:
+                    with PROFILER.phase('save_snapshot'):
+                        save_snapshot(tree, self.snapshot_path)
+                except Exception as error:
+                    self.snapshot_error = error
+        except Exception as error:
+            self.error = error
+        finally:
+            self.done = True
+
+    def _preview(self, folders, entries):
+        """Publish a preview of the tree if enough time has passed since the
+        last one.
+
+        Called by FileSystemTree while it scans; see its constructor for the
+        meaning of the arguments.
+
+        @type self: BackgroundScan
+        @type folders: list[(str, list[FileSystemTree])]
+        @type entries: int
+        @rtype: None
+        """
+        self.entries = entries
+        now = time.perf_counter()
+        if now - self._last_preview < self._interval or len(folders) == 0:
+            return
+        with PROFILER.phase('preview'):
+            # Build the preview from the innermost folder outwards, so that
+            # each folder's preview can be added to its parent's.
+            preview = None
+            for depth in range(len(folders) - 1, -1, -1):
+                name, subtrees = folders[depth]
+                size = sum(subtree.data_size for subtree in subtrees)
+                if preview is not None:
+                    size += preview.data_size
+                if depth + 1 >= PREVIEW_DEPTH:
+                    # Too deep to show the contents: keep the total size.
+                    preview = FileSystemTree._from_scan(name, [], size)
+                else:
+                    copies = _copy_subtrees(subtrees,
+                                            PREVIEW_DEPTH - depth - 1)
+                    if preview is not None:
+                        copies.append(preview)
+                    preview = FileSystemTree._from_scan(name, copies, size)
+            self._publish(preview)
+        self._last_preview = time.perf_counter()
+        self._interval = max(PREVIEW_INTERVAL,
+                             PREVIEW_BACKOFF * (self._last_preview - now))
+
+    def _publish(self, tree):
+        """Make <tree> the most recently published tree.
+
+        @type self: BackgroundScan
+        @type tree: FileSystemTree
+        @rtype: None
+        """
+        with self._lock:
+            self._latest = tree
+            self._version += 1
+
+    def poll(self, version):
+        """Return the most recently published tree and its version number,
+        or None and <version> if nothing has been published since <version>.
+
+        @type self: BackgroundScan
+        @type version: int
+        @rtype: (FileSystemTree | None, int)
+        """
+        with self._lock:
+            if self._version == version:
+                return None, version
+            return self._latest, self._version
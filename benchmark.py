@@ -0,0 +1,318 @@
+"""Treemap Benchmarks
+
+=== Module Description ===
+This module times the main operations of the treemap visualiser: scanning a
+file system, running the treemap algorithm, finding the leaf under a mouse
+click, removing a leaf, changing a leaf's size, and finding the largest
+leaves.
+
+The layout and selection operations are timed on synthetic trees whose size,
+depth and fan-out are configurable, so that the results do not depend on the
+contents of the machine the benchmarks are run on. Scanning is timed on a
+temporary directory tree with the same shape.
+
+Results can be saved as JSON, and compared against previously saved results
+to catch performance regressions. For example:
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --baseline baseline.json
+
+The second command exits with status 1 if any benchmark is more than
+--tolerance slower than its baseline, and with status 2, without running
+anything, if the baseline was saved with different parameters.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from tree_data import AbstractTree, FileSystemTree
+
+
+# The area that the treemap is laid out in; the same as the visualiser's.
+BENCHMARK_RECT = (0, 0, 1024, 570)
+
+
+class SyntheticTree(AbstractTree):
+    """A tree of randomly sized leaves, used for benchmarking.
+
+    The _root attribute of each node is a generated name, e.g. 'd3' or
+    'f12.dat'.
+    """
+    def get_separator(self):
+        """Return the string used to separate nodes in the string
+        representation of a path from the tree root to a leaf.
+
+        @type self: SyntheticTree
+        @rtype: str
+        """
+        return '/'
+
+
+def build_synthetic_tree(leaves, depth, fanout, seed=0):
+    """Return a SyntheticTree with at most <leaves> leaves.
+
+    Every internal node has <fanout> subtrees, and every leaf is <depth> levels
+    below the root, until <leaves> leaves have been created; the tree is then
+    cut off. Leaf sizes are chosen randomly, using <seed>.
+
+    Precondition: leaves >= 1, depth >= 1, fanout >= 1
+
+    @type leaves: int
+    @type depth: int
+    @type fanout: int
+    @type seed: int
+    @rtype: SyntheticTree
+    """
+    rng = random.Random(seed)
+    remaining = [leaves]
+
+    def build(name, level):
+        """Return the synthetic subtree named <name> at <level>.
+
+        @type name: str
+        @type level: int
+        @rtype: SyntheticTree
+        """
+        if level == depth:
+            remaining[0] -= 1
+            return SyntheticTree(name + '.dat', [], rng.randint(1, 1 << 20))
+        subtrees = []
+        for i in range(fanout):
+            if remaining[0] == 0:
+                break
+            subtrees.append(build(name + '_' + str(i), level + 1))
+        return SyntheticTree(name, subtrees)
+
+    return build('root', 0)
+
+
+def build_temporary_directory(files, depth, fanout, seed=0):
+    """Create a temporary directory tree shaped like the tree returned by
+    build_synthetic_tree, and return its path.
+
+    Every file contains up to 1 KB of data. The caller is responsible for
+    removing the directory.
+
+    @type files: int
+    @type depth: int
+    @type fanout: int
+    @type seed: int
+    @rtype: str
+    """
+    rng = random.Random(seed)
+    root = tempfile.mkdtemp(prefix='treemap_bench_')
+    remaining = [files]
+
+    def build(path, level):
+        """Fill the directory at <path>, which is at <level>.
+
+        @type path: str
+        @type level: int
+        @rtype: None
+        """
+        for i in range(fanout):
+            if remaining[0] == 0:
+                return
+            subitem = os.path.join(path, 'd' + str(i))
+            if level + 1 == depth:
+                remaining[0] -= 1
+                with open(subitem + '.dat', 'wb') as f:
+                    f.write(b'\0' * rng.randint(1, 1024))
+            else:
+                os.mkdir(subitem)
+                build(subitem, level + 1)
+
+    build(root, 0)
+    return root
+
+
+def _time(function, repeats, setup=None):
+    """Call <function> <repeats> times, and return the minimum and median
+    times taken, in seconds.
+
+    If <setup> is given, it is called (untimed) before each call, and its
+    return value is passed to <function>.
+
+    @type function: (() -> object) | ((object) -> object)
+    @type repeats: int
+    @type setup: (() -> object) | None
+    @rtype: dict[str, float | int]
+    """
+    times = []
+    for _ in range(repeats):
+        if setup is None:
+            start = time.perf_counter()
+            function()
+        else:
+            argument = setup()
+            start = time.perf_counter()
+            function(argument)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {'min': times[0], 'median': times[len(times) // 2],
+            'repeats': repeats}
+
+
+def run_benchmarks(leaves, depth, fanout, files, repeats, seed=0):
+    """Run every benchmark, and return the results.
+
+    @type leaves: int
+        The number of leaves in the synthetic trees.
+    @type depth: int
+    @type fanout: int
+    @type files: int
+        The number of files in the temporary directory tree that is scanned.
+    @type repeats: int
+    @type seed: int
+    @rtype: dict[str, dict[str, float | int]]
+    """
+    results = {}
+    rng = random.Random(seed)
+    tree = build_synthetic_tree(leaves, depth, fanout, seed)
+    treemap = tree.generate_treemap(BENCHMARK_RECT)
+
+    results['generate_treemap'] = _time(
+        lambda: tree.generate_treemap(BENCHMARK_RECT), repeats)
+
+    def click():
+        """Return a random location in the treemap.
+
+        @rtype: (int, int)
+        """
+        return (rng.randrange(BENCHMARK_RECT[2]),
+                rng.randrange(BENCHMARK_RECT[3]))
+
+    results['get_text'] = _time(lambda: tree.get_text(click(), treemap),
+                                repeats)
+
+    _, selected_leaf = tree.get_text(click(), treemap)
+    results['change_leaf_size'] = _time(
+        lambda: tree.change_leaf_size(selected_leaf, True), repeats)
+
+    # Each query follows a change to the tree, so that it measures how much
+    # of the cached summaries has to be recomputed.
+    tree.largest_leaves()
+    results['largest_leaves'] = _time(
+        lambda _: tree.largest_leaves(), repeats,
+        lambda: tree.change_leaf_size(selected_leaf, True))
+
+    # Each removal changes the tree, so the treemap is recomputed (untimed)
+    # before each one.
+    results['remove_leaf'] = _time(
+        lambda treemap: tree.remove_leaf(click(), treemap), repeats,
+        lambda: tree.generate_treemap(BENCHMARK_RECT))
+
+    path = build_temporary_directory(files, depth, fanout, seed)
+    try:
+        results['scan'] = _time(lambda: FileSystemTree(path), repeats)
+    finally:
+        shutil.rmtree(path)
+    return results
+
+
+def compare_results(results, baseline, tolerance):
+    """Return a list of messages describing each benchmark in <results> whose
+    minimum time is more than <tolerance> (a fraction) slower than in
+    <baseline>.
+
+    Benchmarks that are missing from <baseline> are ignored.
+
+    @type results: dict[str, dict[str, float | int]]
+    @type baseline: dict[str, dict[str, float | int]]
+    @type tolerance: float
+    @rtype: list[str]
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        old = baseline[name]['min']
+        new = result['min']
+        if new > old * (1 + tolerance):
+            regressions.append('{}: {:.6f}s -> {:.6f}s ({:+.0%})'.format(
+                name, old, new, new / old - 1 if old else float('inf')))
+    return regressions
+
+
+def main(argv):
+    """Run the benchmarks with the command-line arguments <argv>, and return
+    the exit status.
+
+    @type argv: list[str]
+    @rtype: int
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--leaves', type=int, default=10000,
+                        help='number of leaves in the synthetic trees')
+    parser.add_argument('--depth', type=int, default=4,
+                        help='depth of the synthetic and scanned trees')
+    parser.add_argument('--fanout', type=int, default=10,
+                        help='subtrees per internal node')
+    parser.add_argument('--files', type=int, default=1000,
+                        help='number of files in the scanned directory tree')
+    parser.add_argument('--repeats', type=int, default=5,
+                        help='times to run each benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', metavar='PATH',
+                        help='save the results as JSON to PATH')
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='compare the results with the JSON at PATH')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown relative to the baseline, '
+                             'as a fraction (default: 0.25)')
+    args = parser.parse_args(argv)
+    parameters = {'leaves': args.leaves, 'depth': args.depth,
+                  'fanout': args.fanout, 'files': args.files,
+                  'repeats': args.repeats, 'seed': args.seed}
+
+    # Check the baseline before running anything: timings of differently
+    # sized trees cannot be compared.
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        if saved['parameters'] != parameters:
+            print('{} was run with different parameters:'.format(
+                args.baseline), file=sys.stderr)
+            for name in sorted(parameters):
+                if saved['parameters'].get(name) != parameters[name]:
+                    print('  --{} {} (now {})'.format(
+                        name, saved['parameters'].get(name),
+                        parameters[name]), file=sys.stderr)
+            return 2
+        baseline = saved['results']
+
+    results = run_benchmarks(args.leaves, args.depth, args.fanout,
+                             args.files, args.repeats, args.seed)
+    for name, result in sorted(results.items()):
+        print('{:<20} min {:.6f}s  median {:.6f}s'.format(
+            name, result['min'], result['median']))
+
+    if args.save is not None:
+        output = {
+            'parameters': parameters,
+            'python': platform.python_version(),
+            'results': results,
+        }
+        with open(args.save, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        regressions = compare_results(results, baseline, args.tolerance)
+        if regressions:
+            print('Regressions against {}:'.format(args.baseline))
+            for message in regressions:
+                print('  ' + message)
+            return 1
+        print('No regressions against {}.'.format(args.baseline))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
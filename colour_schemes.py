@@ -0,0 +1,145 @@
+"""Treemap Colour Schemes
+
+=== Module Description ===
+This module contains the colour schemes used to colour the leaves of an
+AbstractTree. A colour scheme is a function that takes a tree and returns
+an RGB colour; AbstractTree only calls it the first time a tree's colour is
+needed, which in practice means only for the leaves that are drawn.
+
+Every scheme is deterministic, so the same tree is coloured the same way on
+every run. Colours are looked up in tables that are computed once, when this
+module is imported:
+  - 'path' picks a colour from PALETTE using a hash of the tree's path.
+  - 'extension' picks a colour from PALETTE using a hash of the tree's
+    extension, so that all files of the same type have the same colour.
+  - 'size' picks a colour from GRADIENT according to the order of magnitude
+    of the tree's data_size, from blue (small) to red (large).
+
+Further schemes can be added with register_colour_scheme.
+"""
+import colorsys
+import zlib
+
+
+def _build_palette(size):
+    """Return <size> distinct, bright RGB colours.
+
+    Hues are spaced by the golden ratio so that neighbouring entries are
+    easy to tell apart.
+
+    @type size: int
+    @rtype: tuple[(int, int, int)]
+    """
+    palette = []
+    for i in range(size):
+        hue = (i * 0.618033988749895) % 1.0
+        saturation = 0.55 + 0.35 * ((i * 7) % 4) / 3
+        value = 0.75 + 0.2 * ((i * 5) % 3) / 2
+        r, g, b = colorsys.hsv_to_rgb(hue, saturation, value)
+        palette.append((int(r * 255), int(g * 255), int(b * 255)))
+    return tuple(palette)
+
+
+def _build_gradient(size):
+    """Return <size> RGB colours going from blue through green to red.
+
+    @type size: int
+    @rtype: tuple[(int, int, int)]
+    """
+    gradient = []
+    for i in range(size):
+        hue = (2 / 3) * (1 - i / (size - 1))
+        r, g, b = colorsys.hsv_to_rgb(hue, 0.85, 0.95)
+        gradient.append((int(r * 255), int(g * 255), int(b * 255)))
+    return tuple(gradient)
+
+
+# The colours used by the hash-based schemes. Its length is a power of two,
+# so that a hash can be turned into an index with a mask.
+PALETTE = _build_palette(256)
+# The colours used by the size scheme, indexed by the number of bits in a
+# data_size.
+GRADIENT = _build_gradient(64)
+# The colour of trees without an extension in the 'extension' scheme.
+NO_EXTENSION_COLOUR = (128, 128, 128)
+
+
+def path_colour(tree):
+    """Return a colour for <tree> based on its path from the root.
+
+    @type tree: AbstractTree
+    @rtype: (int, int, int)
+
+    The colour only depends on the path, so it is the same for separately
+    built trees, and on every run:
+
+    >>> from benchmark import build_synthetic_tree
+    >>> leaf = build_synthetic_tree(20, 2, 5)._subtrees[1]._subtrees[3]
+    >>> leaf.get_path()
+    'root/root_1/root_1_3.dat'
+    >>> path_colour(leaf)
+    (80, 19, 191)
+    >>> other = build_synthetic_tree(20, 2, 5, seed=1)
+    >>> path_colour(other._subtrees[1]._subtrees[3]) == path_colour(leaf)
+    True
+    """
+    path = tree.get_path()
+    return PALETTE[zlib.crc32(path.encode('utf-8', 'surrogateescape')) &
+                   (len(PALETTE) - 1)]
+
+
+def extension_colour(tree):
+    """Return a colour for <tree> based on its extension.
+
+    @type tree: AbstractTree
+    @rtype: (int, int, int)
+
+    >>> from tree_data import FileSystemTree
+    >>> extension_colour(FileSystemTree._from_scan('a.PY', [], 1000))
+    (75, 41, 191)
+    >>> extension_colour(FileSystemTree._from_scan('b.py', [], 3))
+    (75, 41, 191)
+    >>> extension_colour(FileSystemTree._from_scan('Makefile', [], 3))
+    (128, 128, 128)
+    """
+    extension = tree.get_extension()
+    if extension == '':
+        return NO_EXTENSION_COLOUR
+    return PALETTE[zlib.crc32(extension.encode('utf-8', 'surrogateescape')) &
+                   (len(PALETTE) - 1)]
+
+
+def size_colour(tree):
+    """Return a colour for <tree> based on the order of magnitude of its
+    data_size.
+
+    @type tree: AbstractTree
+    @rtype: (int, int, int)
+
+    >>> from tree_data import FileSystemTree
+    >>> size_colour(FileSystemTree._from_scan('a', [], 1000))
+    (36, 167, 242)
+    >>> size_colour(FileSystemTree._from_scan('b', [], 1023))
+    (36, 167, 242)
+    >>> size_colour(FileSystemTree._from_scan('c', [], 3))
+    (36, 62, 242)
+    """
+    return GRADIENT[min(tree.data_size.bit_length(), len(GRADIENT) - 1)]
+
+
+# The available colour schemes, by name.
+COLOUR_SCHEMES = {
+    'path': path_colour,
+    'extension': extension_colour,
+    'size': size_colour,
+}
+
+
+def register_colour_scheme(name, scheme):
+    """Make <scheme> available as the colour scheme called <name>.
+
+    @type name: str
+    @type scheme: (AbstractTree) -> (int, int, int)
+    @rtype: None
+    """
+    COLOUR_SCHEMES[name] = scheme
@@ -1,28 +1,45 @@
-import os
+import sys
 
+from scanner import scan, ScanOptions, DIRECTORY_END, FILE
 
-def print_items(d, indentation):
-    """A sample program showing how to recurse on directories using os.
 
-    Print the list of files and directories in directory <d>, recursively,
-    prefixing each with the given indentation.
+def print_items(d, indentation, options=None, all_files=False):
+    """A du-style report of the sizes of the folders in <d>.
+
+    Print the total size (in bytes) and path of each folder in <d>,
+    recursively, prefixing each path with the given indentation plus four
+    spaces per level below <d>. Each folder is printed as soon as it has been
+    scanned, so its contents come before it, and memory use depends only on
+    the folders that are open, not on the total number of files.
+
+    If <all_files> is True, the size and path of each file is printed too.
+    <options> controls which files and folders are scanned; see
+    scanner.ScanOptions.
 
     @type d: str
     @type indentation: str
+    @type options: ScanOptions | None
+    @type all_files: bool
     @rtype: None
     """
-    print(indentation + d + ':')
-    for filename in os.listdir(d):
-        print(indentation + filename)
-        subitem = os.path.join(d, filename)
-        if os.path.isdir(subitem):
-            print_items(subitem, indentation + '    ')
+    for entry in scan(d, options):
+        if entry.kind == DIRECTORY_END or (all_files and entry.kind == FILE):
+            print('{:>12}  {}{}{}'.format(entry.size, indentation,
+                                          '    ' * entry.depth, entry.path))
 
 
 if __name__ == '__main__':
-    # Put in a path like
+    # Pass a path like
     # 'C:\\Users\\David\\Documents\\csc148\\assignments' (Windows) or
     # '/Users/dianeh/Documents/courses/csc148/assignments' (OSX)
-    # to print the contents of that folder.
-    print_items('C:\\Users\\HP\\Documents\\Year 1\\CSC148\\exercises\\ex7',
-                '  ')
+    # to print the sizes of the folders in it, and optionally how many of
+    # the largest files to list in each folder; the rest are totalled on
+    # one line.
+    if len(sys.argv) not in (2, 3):
+        print('Usage: python {} <path> [files per folder]'.format(sys.argv[0]))
+        exit(1)
+    elif len(sys.argv) == 3:
+        print_items(sys.argv[1], '  ',
+                    ScanOptions(collapse_top_n=int(sys.argv[2])), True)
+    else:
+        print_items(sys.argv[1], '  ')
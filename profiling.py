@@ -0,0 +1,197 @@
+"""Treemap Profiling
+
+=== Module Description ===
+This module contains lightweight instrumentation for the treemap visualiser.
+Each phase of the program (scanning, laying out the treemap, hit-testing a
+click, drawing, ...) is wrapped in a call to PROFILER.phase, which records
+how many times the phase ran and how long it took.
+
+Profiling is off by default. It is turned on by setting the TREEMAP_PROFILE
+environment variable, or by passing --profile to the visualiser. Setting
+TREEMAP_HUD (or passing --hud) also shows the most recent frame time, layout
+time and rectangle count in the visualiser's text bar.
+
+When profiling is off, PROFILER.phase returns a shared context manager that
+does nothing, so the instrumentation costs one method call per phase.
+"""
+import os
+import time
+
+
+class _NullPhase:
+    """A context manager that does nothing, used when profiling is off.
+    """
+    def __enter__(self):
+        """Do nothing.
+
+        @type self: _NullPhase
+        @rtype: None
+        """
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Do nothing.
+
+        @type self: _NullPhase
+        @rtype: bool
+        """
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    """A context manager that times one run of a phase.
+
+    === Private Attributes ===
+    @type _profiler: Profiler
+        The profiler to record the time in.
+    @type _name: str
+        The name of the phase.
+    @type _start: float
+        The time at which the phase started.
+    """
+    def __init__(self, profiler, name):
+        """Initialize a new _Phase.
+
+        @type self: _Phase
+        @type profiler: Profiler
+        @type name: str
+        @rtype: None
+        """
+        self._profiler = profiler
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self):
+        """Start timing the phase.
+
+        @type self: _Phase
+        @rtype: None
+        """
+        self._start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop timing the phase, and record the time taken.
+
+        @type self: _Phase
+        @rtype: bool
+        """
+        self._profiler.record(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class Profiler:
+    """Counts and timings of each phase of the treemap visualiser.
+
+    === Public Attributes ===
+    @type enabled: bool
+        Whether phases are being timed.
+    @type hud: bool
+        Whether the visualiser should display timings in its text bar.
+
+    === Private Attributes ===
+    @type _counts: dict[str, int]
+        The number of times each phase has run.
+    @type _totals: dict[str, float]
+        The total time spent in each phase, in seconds.
+    @type _last: dict[str, float]
+        The time taken by the most recent run of each phase, in seconds.
+    @type _values: dict[str, int]
+        The most recent value of each counter set with set_value.
+    """
+    def __init__(self, enabled=False, hud=False):
+        """Initialize a new Profiler.
+
+        If <hud> is True, profiling is enabled as well.
+
+        @type self: Profiler
+        @type enabled: bool
+        @type hud: bool
+        @rtype: None
+        """
+        self.enabled = enabled or hud
+        self.hud = hud
+        self._counts = {}
+        self._totals = {}
+        self._last = {}
+        self._values = {}
+
+    def phase(self, name):
+        """Return a context manager that times the phase called <name>.
+
+        @type self: Profiler
+        @type name: str
+        @rtype: _Phase | _NullPhase
+        """
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def record(self, name, seconds):
+        """Record a run of the phase called <name> that took <seconds>.
+
+        @type self: Profiler
+        @type name: str
+        @type seconds: float
+        @rtype: None
+        """
+        self._counts[name] = self._counts.get(name, 0) + 1
+        self._totals[name] = self._totals.get(name, 0.0) + seconds
+        self._last[name] = seconds
+
+    def set_value(self, name, value):
+        """Record the current <value> of the counter called <name>.
+
+        Does nothing if profiling is off.
+
+        @type self: Profiler
+        @type name: str
+        @type value: int
+        @rtype: None
+        """
+        if self.enabled:
+            self._values[name] = value
+
+    def last(self, name):
+        """Return the time taken by the most recent run of the phase called
+        <name>, in seconds, or 0.0 if it has not run.
+
+        @type self: Profiler
+        @type name: str
+        @rtype: float
+        """
+        return self._last.get(name, 0.0)
+
+    def hud_text(self):
+        """Return the text of the on-screen performance display.
+
+        @type self: Profiler
+        @rtype: str
+        """
+        return 'frame {:.1f}ms  layout {:.1f}ms  rects {}'.format(
+            self.last('frame') * 1000, self.last('layout') * 1000,
+            self._values.get('rectangles', 0))
+
+    def report(self):
+        """Return a summary of every phase that has run.
+
+        @type self: Profiler
+        @rtype: str
+        """
+        lines = ['{:<18} {:>8} {:>12} {:>12}'.format(
+            'phase', 'count', 'total (ms)', 'mean (ms)')]
+        for name in sorted(self._counts):
+            count = self._counts[name]
+            total = self._totals[name] * 1000
+            lines.append('{:<18} {:>8} {:>12.2f} {:>12.3f}'.format(
+                name, count, total, total / count))
+        for name in sorted(self._values):
+            lines.append('{:<18} {:>8}'.format(name, self._values[name]))
+        return '\n'.join(lines)
+
+
+# The profiler used throughout the visualiser.
+PROFILER = Profiler(bool(os.environ.get('TREEMAP_PROFILE')),
+                    bool(os.environ.get('TREEMAP_HUD')))
@@ -0,0 +1,318 @@
+"""File System Scanner
+
+=== Module Description ===
+This module walks a file or folder on this computer, and reports what it
+finds as a stream of ScanEntry tuples. FileSystemTree builds its tree from
+this stream.
+
+The walk is iterative, so it is not limited by Python's recursion limit, and
+only keeps the entries of the folders that are currently open in memory.
+
+ScanOptions controls what is walked:
+  - Entries whose name matches one of the exclude patterns are skipped, and
+    excluded folders are never opened.
+  - Folders deeper than max_depth are left out entirely: they are not
+    reported, and the files in them are not counted in any folder's size.
+    (Finding their sizes would mean walking them, which is what max_depth
+    is meant to avoid.)
+  - Folders on a different file system from the scanned path can be skipped.
+  - Symbolic links are not followed unless follow_symlinks is set, so links
+    to folders cannot make the walk loop forever.
+  - A file with several hard links is only reported the first time one of
+    its links is found, so that its size is only counted once.
+  - Files smaller than collapse_below, or beyond the collapse_top_n largest
+    files in their folder, are not reported one by one: they are folded into
+    a single file called OTHER_NAME in that folder, whose size is their
+    total size. This greatly reduces the number of entries for folders full
+    of small files.
+
+The size of a folder is the total size of the files reported inside it.
+"""
+import fnmatch
+import os
+import stat
+from collections import namedtuple
+
+
+# The kinds of ScanEntry.
+DIRECTORY_START = 'start'
+FILE = 'file'
+DIRECTORY_END = 'end'
+
+# The name of the entry that collapsed files are folded into. It cannot be
+# the name of a real file on Windows, and is unlikely to be one elsewhere.
+OTHER_NAME = '<other>'
+
+# An item found by scan.
+# kind is one of DIRECTORY_START, FILE or DIRECTORY_END. name is the item's
+# name and path its full path. depth is 0 for the scanned path, 1 for the
+# items in it, and so on. size is the size of a file, the total size of a
+# folder for DIRECTORY_END, or 0 for DIRECTORY_START.
+ScanEntry = namedtuple('ScanEntry', ['kind', 'name', 'path', 'depth', 'size'])
+
+
+class ScanOptions:
+    """Options that control what scan walks.
+
+    === Public Attributes ===
+    @type exclude: list[str]
+        Glob patterns; files and folders whose name matches any of them are
+        skipped. E.g., ['.git', 'node_modules', '*.tmp'].
+    @type max_depth: int | None
+        The depth of the deepest folders that are reported, where the
+        scanned path has depth 0, or None for no limit. Deeper folders, and
+        everything in them, are left out.
+    @type one_file_system: bool
+        Whether to skip folders on a different file system from the
+        scanned path.
+    @type follow_symlinks: bool
+        Whether to follow symbolic links. Each folder is still only scanned
+        once, however many links lead to it.
+    @type dedupe_hard_links: bool
+        Whether to only report each file once, however many hard links it
+        has.
+    @type collapse_below: int
+        Files smaller than this many bytes are folded into their folder's
+        OTHER_NAME entry.
+    @type collapse_top_n: int | None
+        If not None, only this many of the largest files in each folder are
+        reported; the rest are folded into the folder's OTHER_NAME entry.
+    """
+    def __init__(self, exclude=(), max_depth=None, one_file_system=False,
+                 follow_symlinks=False, dedupe_hard_links=True,
+                 collapse_below=0, collapse_top_n=None):
+        """Initialize a new ScanOptions.
+
+        @type self: ScanOptions
+        @type exclude: list[str] | tuple[str]
+        @type max_depth: int | None
+        @type one_file_system: bool
+        @type follow_symlinks: bool
+        @type dedupe_hard_links: bool
+        @type collapse_below: int
+        @type collapse_top_n: int | None
+        @rtype: None
+        """
+        self.exclude = list(exclude)
+        self.max_depth = max_depth
+        self.one_file_system = one_file_system
+        self.follow_symlinks = follow_symlinks
+        self.dedupe_hard_links = dedupe_hard_links
+        self.collapse_below = collapse_below
+        self.collapse_top_n = collapse_top_n
+
+    def is_excluded(self, name):
+        """Return whether the file or folder called <name> should be skipped.
+
+        @type self: ScanOptions
+        @type name: str
+        @rtype: bool
+        """
+        for pattern in self.exclude:
+            if fnmatch.fnmatchcase(name, pattern):
+                return True
+        return False
+
+
+def _list_entries(path):
+    """Return the entries of the folder at <path>, or an empty list if it
+    cannot be read.
+
+    @type path: str
+    @rtype: list[os.DirEntry]
+    """
+    try:
+        with os.scandir(path) as entries:
+            return list(entries)
+    except OSError:
+        return []
+
+
+def _open_folder(path, depth, options, root_stat, seen):
+    """Return the files and folders in the folder at <path>, which is at
+    <depth>, that should be reported.
+
+    The files are returned as FILE entries, with any collapsed files already
+    folded into an OTHER_NAME entry. The folders are returned as the
+    os.DirEntry of each one, and have not been opened yet.
+
+    @type path: str
+    @type depth: int
+    @type options: ScanOptions
+    @type root_stat: os.stat_result
+        The result of os.stat for the scanned path.
+    @type seen: set[(int, int)]
+        The (device, inode) of every folder and hard-linked file that has
+        been reported so far. Updated by this function.
+    @rtype: (list[ScanEntry], list[os.DirEntry])
+    """
+    files = []
+    folders = []
+    for entry in _list_entries(path):
+        if options.is_excluded(entry.name):
+            continue
+        try:
+            entry_stat = entry.stat(follow_symlinks=options.follow_symlinks)
+        except OSError:
+            continue
+
+        if stat.S_ISDIR(entry_stat.st_mode):
+            if options.max_depth is not None and depth >= options.max_depth:
+                continue
+            if options.one_file_system and \
+                    entry_stat.st_dev != root_stat.st_dev:
+                continue
+            if options.follow_symlinks:
+                key = (entry_stat.st_dev, entry_stat.st_ino)
+                if key in seen:  # Reached again through a symbolic link.
+                    continue
+                seen.add(key)
+            folders.append(entry)
+        else:
+            if options.dedupe_hard_links and entry_stat.st_nlink > 1:
+                key = (entry_stat.st_dev, entry_stat.st_ino)
+                if key in seen:
+                    continue
+                seen.add(key)
+            files.append(ScanEntry(FILE, entry.name, entry.path, depth + 1,
+                                   entry_stat.st_size))
+
+    if options.collapse_below > 0 or options.collapse_top_n is not None:
+        kept = [file for file in files if file.size >= options.collapse_below]
+        if options.collapse_top_n is not None and \
+                len(kept) > options.collapse_top_n:
+            kept.sort(key=lambda file: file.size, reverse=True)
+            kept = kept[:options.collapse_top_n]
+        if len(kept) < len(files):
+            other_size = sum(file.size for file in files) - \
+                sum(file.size for file in kept)
+            kept.append(ScanEntry(FILE, OTHER_NAME,
+                                  os.path.join(path, OTHER_NAME), depth + 1,
+                                  other_size))
+        files = kept
+    return files, folders
+
+
+def scan(path, options=None):
+    """Walk the file or folder at <path>, and yield a ScanEntry for each
+    item found.
+
+    A folder is reported as a DIRECTORY_START entry, followed by the entries
+    for the files in it, followed by the entries for each folder in it,
+    followed by a DIRECTORY_END entry that carries its total size. Items
+    that cannot be read are skipped.
+
+    Precondition: <path> is a valid path for this computer.
+
+    @type path: str
+    @type options: ScanOptions | None
+    @rtype: iterator[ScanEntry]
+
+    >>> import shutil
+    >>> import tempfile
+    >>> folder = tempfile.mkdtemp()
+    >>> root = os.path.join(folder, 'root')
+    >>> def make(name, size):
+    ...     path = os.path.join(root, *name.split('/'))
+    ...     os.makedirs(os.path.dirname(path), exist_ok=True)
+    ...     with open(path, 'wb') as f:
+    ...         _ = f.write(b'x' * size)
+    >>> make('big.dat', 100)
+    >>> make('small.txt', 5)
+    >>> make('tiny.txt', 1)
+    >>> make('.git/HEAD', 50)
+    >>> make('sub/c.txt', 3)
+    >>> make('sub/deep/d.txt', 4)
+    >>> os.link(os.path.join(root, 'big.dat'),
+    ...         os.path.join(root, 'sub', 'big-link.dat'))
+    >>> os.symlink('..', os.path.join(root, 'sub', 'loop'))
+    >>> def show(options=None):
+    ...     entries = list(scan(root, options))
+    ...     for entry in sorted(entries, key=lambda entry: entry.path):
+    ...         if entry.kind != DIRECTORY_START:
+    ...             print(entry.kind, entry.depth,
+    ...                   os.path.relpath(entry.path, folder), entry.size)
+
+    The second link to big.dat is not counted, and the symbolic link is
+    reported as a file of its own (its size is the length of '..'):
+
+    >>> show()
+    end 0 root 165
+    end 1 root/.git 50
+    file 2 root/.git/HEAD 50
+    file 1 root/big.dat 100
+    file 1 root/small.txt 5
+    end 1 root/sub 9
+    file 2 root/sub/c.txt 3
+    end 2 root/sub/deep 4
+    file 3 root/sub/deep/d.txt 4
+    file 2 root/sub/loop 2
+    file 1 root/tiny.txt 1
+
+    Following the symbolic link leads back to root, which is not scanned
+    again:
+
+    >>> show(ScanOptions(follow_symlinks=True))
+    end 0 root 163
+    end 1 root/.git 50
+    file 2 root/.git/HEAD 50
+    file 1 root/big.dat 100
+    file 1 root/small.txt 5
+    end 1 root/sub 7
+    file 2 root/sub/c.txt 3
+    end 2 root/sub/deep 4
+    file 3 root/sub/deep/d.txt 4
+    file 1 root/tiny.txt 1
+    >>> show(ScanOptions(exclude=['.git', '*.txt'], max_depth=1))
+    end 0 root 102
+    file 1 root/big.dat 100
+    end 1 root/sub 2
+    file 2 root/sub/loop 2
+    >>> show(ScanOptions(exclude=['.git', 'sub'], collapse_below=5))
+    end 0 root 106
+    file 1 root/<other> 1
+    file 1 root/big.dat 100
+    file 1 root/small.txt 5
+    >>> show(ScanOptions(exclude=['.git', 'sub'], collapse_top_n=1))
+    end 0 root 106
+    file 1 root/<other> 6
+    file 1 root/big.dat 100
+    >>> shutil.rmtree(folder)
+    """
+    if options is None:
+        options = ScanOptions()
+    name = os.path.basename(path)
+    root_stat = os.stat(path)
+    if not stat.S_ISDIR(root_stat.st_mode):
+        yield ScanEntry(FILE, name, path, 0, root_stat.st_size)
+        return
+
+    seen = {(root_stat.st_dev, root_stat.st_ino)}
+    # The name, path and depth of the folder to open next, if any.
+    opening = (name, path, 0)
+    # Each frame is [name, path, depth, folders, next folder index, size].
+    stack = []
+    while True:
+        if opening is not None:
+            name, path, depth = opening
+            opening = None
+            yield ScanEntry(DIRECTORY_START, name, path, depth, 0)
+            files, folders = _open_folder(path, depth, options, root_stat,
+                                          seen)
+            size = 0
+            for file in files:
+                yield file
+                size += file.size
+            stack.append([name, path, depth, folders, 0, size])
+
+        frame = stack[-1]
+        name, path, depth, folders, index, size = frame
+        if index == len(folders):
+            stack.pop()
+            yield ScanEntry(DIRECTORY_END, name, path, depth, size)
+            if not stack:
+                return
+            stack[-1][5] += size
+        else:
+            frame[4] += 1
+            opening = (folders[index].name, folders[index].path, depth + 1)
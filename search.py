@@ -0,0 +1,235 @@
+"""Treemap Search
+
+=== Module Description ===
+This module contains SearchIndex, an index of the leaves of an AbstractTree
+by name and by extension, which answers queries such as
+
+    *.log larger than 1 GB
+    report*.pdf smaller than 200 KB
+    *cache*
+
+without walking the tree. A query is a case-insensitive glob pattern for the
+leaf's name, followed by any number of size conditions.
+
+A FileSystemTree fills in an index while it scans, if it is given one.
+Other trees can be indexed after they are built, with SearchIndex.from_tree.
+"""
+import bisect
+import fnmatch
+import os
+import re
+
+
+# The multiplier for each size unit accepted in queries.
+SIZE_UNITS = {'': 1, 'b': 1,
+              'k': 1 << 10, 'kb': 1 << 10,
+              'm': 1 << 20, 'mb': 1 << 20,
+              'g': 1 << 30, 'gb': 1 << 30,
+              't': 1 << 40, 'tb': 1 << 40}
+
+_CONDITION = re.compile(
+    r'\s+(larger|bigger|greater|smaller|less)\s+than\s+'
+    r'(\d+(?:\.\d+)?)\s*([a-z]*)', re.IGNORECASE)
+_WILDCARDS = re.compile(r'[*?[]')
+
+
+def parse_query(query):
+    """Return the name pattern of <query>, and the smallest and largest data
+    sizes that its conditions allow.
+
+    The largest size is None if there is no upper limit.
+
+    Raise ValueError if <query> is not a valid query.
+
+    @type query: str
+    @rtype: (str, int, int | None)
+
+    >>> parse_query('*.log larger than 1 GB')
+    ('*.log', 1073741825, None)
+    >>> parse_query('a* smaller than 2kb')
+    ('a*', 0, 2047)
+    """
+    query = query.strip()
+    if query == '':
+        raise ValueError('empty query')
+    pattern, _, rest = query.partition(' ')
+    rest = ' ' + rest if rest else ''
+    minimum, maximum = 0, None
+    end = 0
+    for match in _CONDITION.finditer(rest):
+        if match.start() != end:
+            break
+        end = match.end()
+        comparison, number, unit = match.groups()
+        if unit.lower() not in SIZE_UNITS:
+            raise ValueError('unknown size unit: ' + unit)
+        size = int(float(number) * SIZE_UNITS[unit.lower()])
+        if comparison.lower() in ('smaller', 'less'):
+            maximum = size - 1 if maximum is None else min(maximum, size - 1)
+        else:
+            minimum = max(minimum, size + 1)
+    if rest[end:].strip() != '':
+        raise ValueError('cannot understand: ' + rest[end:].strip())
+    return pattern.lower(), minimum, maximum
+
+
+class SearchIndex:
+    """An index of the leaves of a tree, by name and by extension.
+
+    === Public Attributes ===
+    @type tree: AbstractTree | None
+        The tree whose leaves are indexed, or None if no leaves have been
+        added yet.
+
+    === Private Attributes ===
+    @type _names: list[str]
+        The lower-case names of the indexed leaves.
+    @type _leaves: list[AbstractTree]
+        The indexed leaves; _leaves[i] is named _names[i].
+    @type _sorted: bool
+        Whether _names is sorted (and _leaves is in the same order).
+    @type _by_extension: dict[str, list[AbstractTree]]
+        The indexed leaves with each extension, taken from their lower-case
+        names, so that it agrees with the names that patterns are matched
+        against whatever kind of tree the leaves come from.
+
+    === Representation Invariants ===
+    - len(_names) == len(_leaves)
+    """
+    def __init__(self):
+        """Initialize a new, empty SearchIndex.
+
+        @type self: SearchIndex
+        @rtype: None
+        """
+        self.tree = None
+        self._names = []
+        self._leaves = []
+        self._sorted = True
+        self._by_extension = {}
+
+    @classmethod
+    def from_tree(cls, tree):
+        """Return an index of the leaves of <tree>.
+
+        @type tree: AbstractTree
+        @rtype: SearchIndex
+        """
+        index = cls()
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if len(node._subtrees) == 0:
+                if not node.is_empty():
+                    index.add(node)
+            else:
+                stack.extend(node._subtrees)
+        index.tree = tree
+        return index
+
+    def __len__(self):
+        """Return the number of leaves in this index.
+
+        @type self: SearchIndex
+        @rtype: int
+        """
+        return len(self._leaves)
+
+    def add(self, leaf):
+        """Add <leaf> to this index.
+
+        @type self: SearchIndex
+        @type leaf: AbstractTree
+        @rtype: None
+        """
+        name = str(leaf._root).lower()
+        self._names.append(name)
+        self._leaves.append(leaf)
+        self._sorted = False
+        self._by_extension.setdefault(os.path.splitext(name)[1],
+                                      []).append(leaf)
+
+    def _sort(self):
+        """Sort the leaves of this index by name, if they are not already.
+
+        @type self: SearchIndex
+        @rtype: None
+        """
+        if not self._sorted:
+            order = sorted(range(len(self._names)),
+                           key=self._names.__getitem__)
+            self._names = [self._names[i] for i in order]
+            self._leaves = [self._leaves[i] for i in order]
+            self._sorted = True
+
+    def _candidates(self, pattern):
+        """Return the leaves that might match the lower-case name <pattern>.
+
+        Patterns of the form '*.ext' are looked up by extension, and patterns
+        that start with some literal characters are looked up by name prefix.
+
+        @type self: SearchIndex
+        @type pattern: str
+        @rtype: list[AbstractTree]
+        """
+        self._sort()
+        if pattern.startswith('*.') and '.' not in pattern[2:] and \
+                _WILDCARDS.search(pattern, 1) is None:
+            candidates = self._by_extension.get(pattern[1:], [])
+            # Names made of dots followed by 'ext', like '.bashrc', have no
+            # extension, but match the pattern too.
+            dots = '.'
+            while True:
+                start = bisect.bisect_left(self._names, dots + pattern[2:])
+                end = bisect.bisect_right(self._names, dots + pattern[2:],
+                                          start)
+                if start < end:
+                    candidates = candidates + self._leaves[start:end]
+                dots += '.'
+                start = bisect.bisect_left(self._names, dots)
+                if start == len(self._names) or \
+                        not self._names[start].startswith(dots):
+                    return candidates
+        wildcard = _WILDCARDS.search(pattern)
+        prefix = pattern if wildcard is None else pattern[:wildcard.start()]
+        if prefix == '':
+            return self._leaves
+        start = bisect.bisect_left(self._names, prefix)
+        end = bisect.bisect_left(self._names, prefix + '\U0010ffff', start)
+        return self._leaves[start:end]
+
+    def search(self, query):
+        """Return the leaves that match <query>, largest first.
+
+        Leaves that have been removed from the tree are not returned.
+
+        Raise ValueError if <query> is not a valid query.
+
+        @type self: SearchIndex
+        @type query: str
+        @rtype: list[AbstractTree]
+
+        >>> from benchmark import SyntheticTree
+        >>> tree = SyntheticTree('r', [
+        ...     SyntheticTree('a.log', [], 5), SyntheticTree('B.LOG', [], 9),
+        ...     SyntheticTree('.log', [], 2), SyntheticTree('c.txt', [], 7)])
+        >>> index = SearchIndex.from_tree(tree)
+        >>> [leaf._root for leaf in index.search('*.log')]
+        ['B.LOG', 'a.log', '.log']
+        >>> [leaf._root for leaf in index.search('*.lo? larger than 4')]
+        ['B.LOG', 'a.log']
+        >>> [leaf._root for leaf in index.search('c*')]
+        ['c.txt']
+        """
+        pattern, minimum, maximum = parse_query(query)
+        matches = []
+        for leaf in self._candidates(pattern):
+            if leaf._parent_tree is None and leaf is not self.tree:
+                continue  # The leaf has been removed.
+            if leaf.data_size < minimum or \
+                    (maximum is not None and leaf.data_size > maximum):
+                continue
+            if fnmatch.fnmatchcase(str(leaf._root).lower(), pattern):
+                matches.append(leaf)
+        matches.sort(key=lambda leaf: leaf.data_size, reverse=True)
+        return matches
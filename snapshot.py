@@ -0,0 +1,373 @@
+"""Treemap Snapshots
+
+=== Module Description ===
+This module saves an AbstractTree to a compact binary snapshot file, and
+loads such a file back as a tree whose nodes are only created when they are
+accessed. This makes it possible to scan a volume once, and then reopen the
+scan later (or on another machine) without scanning it again.
+
+A snapshot file has four sections:
+  - A fixed-size header, which records the number of nodes and the offset of
+    each of the other sections.
+  - A node table, with one fixed-size record per node. Nodes are stored in
+    breadth-first order, so that the children of each node are contiguous.
+    Each record holds the position of the node's name in the string pool, the
+    index of its first child, and its number of children.
+  - A sizes array, with the data_size of each node.
+  - A string pool, holding every distinct name (and the tree's separator)
+    exactly once, encoded as UTF-8.
+
+The loader memory-maps the file, so opening a snapshot only reads the header;
+the rest of the file is paged in by the operating system as nodes are
+accessed.
+"""
+import mmap
+import os
+import struct
+from collections import deque
+
+from tree_data import AbstractTree
+
+
+# The first bytes of every snapshot file, and the current format version.
+SNAPSHOT_MAGIC = b'TREEMAP\x00'
+SNAPSHOT_VERSION = 1
+
+# magic, version, node count, node table offset, sizes offset,
+# string pool offset, separator offset, separator length
+_HEADER = struct.Struct('<8sIQQQQQI')
+# name offset, name length, first child index, child count
+_NODE = struct.Struct('<QIII')
+_SIZE = struct.Struct('<Q')
+
+# The name length recorded for a node whose _root is None (an empty tree).
+_NO_NAME = 0xFFFFFFFF
+
+
+def save_snapshot(tree, path):
+    """Save <tree> to a snapshot file at <path>.
+
+    Only the structure, names and data sizes of the tree are saved; colours
+    are not.
+
+    @type tree: AbstractTree
+    @type path: str
+    @rtype: None
+    """
+    strings = bytearray()
+    string_offsets = {}
+
+    def add_string(s):
+        """Return the offset and length of <s> in the string pool, adding
+        it to the pool if it is not there already.
+
+        @type s: str
+        @rtype: (int, int)
+        """
+        if s not in string_offsets:
+            encoded = s.encode('utf-8', 'surrogateescape')
+            string_offsets[s] = (len(strings), len(encoded))
+            strings.extend(encoded)
+        return string_offsets[s]
+
+    separator_offset, separator_length = add_string(tree.get_separator())
+
+    # Breadth-first order: the children of the node at index i are stored
+    # at indexes next_child, ..., next_child + len(node._subtrees) - 1.
+    nodes = bytearray()
+    sizes = bytearray()
+    queue = deque([tree])
+    next_child = 1
+    node_count = 0
+    while queue:
+        node = queue.popleft()
+        if node._root is None:
+            name_offset, name_length = 0, _NO_NAME
+        else:
+            name_offset, name_length = add_string(str(node._root))
+        nodes += _NODE.pack(name_offset, name_length, next_child,
+                            len(node._subtrees))
+        sizes += _SIZE.pack(node.data_size)
+        next_child += len(node._subtrees)
+        queue.extend(node._subtrees)
+        node_count += 1
+
+    nodes_offset = _HEADER.size
+    sizes_offset = nodes_offset + len(nodes)
+    strings_offset = sizes_offset + len(sizes)
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, node_count,
+                             nodes_offset, sizes_offset, strings_offset,
+                             separator_offset, separator_length))
+        f.write(nodes)
+        f.write(sizes)
+        f.write(strings)
+
+
+def load_snapshot(path):
+    """Open the snapshot file at <path>, and return the root of its tree.
+
+    The file stays memory-mapped for as long as any node of the returned
+    tree is in use.
+
+    Raise ValueError if <path> is not a snapshot file, or is truncated. A
+    node whose record is corrupted raises ValueError when it is loaded.
+
+    @type path: str
+    @rtype: SnapshotTree
+
+    >>> import os
+    >>> import shutil
+    >>> import tempfile
+    >>> from tree_data import FileSystemTree
+    >>> folder = tempfile.mkdtemp()
+    >>> path = os.path.join(folder, 'tree.snapshot')
+    >>> tree = FileSystemTree._from_scan('docs', [
+    ...     FileSystemTree._from_scan('a.txt', [], 10),
+    ...     FileSystemTree._from_scan('b', [
+    ...         FileSystemTree._from_scan('c.py', [], 5),
+    ...         FileSystemTree._from_scan('a.txt', [], 7)], 12)], 22)
+    >>> save_snapshot(tree, path)
+    >>> loaded = load_snapshot(path)
+    >>> loaded._root, loaded.data_size
+    ('docs', 22)
+    >>> [(subtree._root, subtree.data_size) for subtree in loaded._subtrees]
+    [('a.txt', 10), ('b', 12)]
+    >>> [(subtree._root, subtree.data_size)
+    ...  for subtree in loaded._subtrees[1]._subtrees]
+    [('c.py', 5), ('a.txt', 7)]
+    >>> loaded._subtrees[1]._subtrees[0].get_path() == os.path.join(
+    ...     'docs', 'b', 'c.py')
+    True
+    >>> save_snapshot(FileSystemTree._from_scan(None, [], 0), path)
+    >>> load_snapshot(path).is_empty()
+    True
+    >>> with open(path, 'wb') as f:
+    ...     _ = f.write(b'not a snapshot')
+    >>> load_snapshot(path)  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    ValueError: ... is not a snapshot file
+    >>> save_snapshot(tree, path)
+    >>> with open(path, 'rb') as f:
+    ...     data = f.read()
+    >>> with open(path, 'wb') as f:
+    ...     _ = f.write(data[:len(data) // 2])
+    >>> load_snapshot(path)  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    ValueError: ... is truncated or corrupted
+
+    Corrupted nodes are only found when they are loaded:
+
+    >>> data = bytearray(data)
+    >>> name_offset, name_length, _, child_count = _NODE.unpack_from(
+    ...     data, _HEADER.size)
+    >>> _NODE.pack_into(data, _HEADER.size, name_offset, name_length,
+    ...                 10 ** 9, child_count)
+    >>> with open(path, 'wb') as f:
+    ...     _ = f.write(data)
+    >>> load_snapshot(path)._subtrees  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    ValueError: ... is truncated or corrupted
+    >>> del loaded
+    >>> shutil.rmtree(folder)
+    """
+    return SnapshotTree(_SnapshotFile(path), 0)
+
+
+class _SnapshotFile:
+    """A memory-mapped snapshot file.
+
+    === Public Attributes ===
+    @type separator: str
+        The separator of the tree that was saved.
+
+    === Private Attributes ===
+    @type _path: str
+        The path of the file, for error messages.
+    @type _map: mmap.mmap
+        The contents of the file.
+    @type _node_count: int
+        The number of nodes in the file.
+    @type _nodes_offset: int
+        The offset of the node table.
+    @type _sizes_offset: int
+        The offset of the sizes array.
+    @type _strings_offset: int
+        The offset of the string pool.
+    """
+    def __init__(self, path):
+        """Memory-map the snapshot file at <path> and read its header.
+
+        @type self: _SnapshotFile
+        @type path: str
+        @rtype: None
+        """
+        self._path = path
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # The file is empty.
+                raise ValueError('{} is not a snapshot file'.format(path))
+        if len(self._map) < _HEADER.size:
+            raise ValueError('{} is not a snapshot file'.format(path))
+        (magic, version, self._node_count, self._nodes_offset,
+         self._sizes_offset, self._strings_offset, separator_offset,
+         separator_length) = _HEADER.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('{} is not a snapshot file'.format(path))
+        if version != SNAPSHOT_VERSION:
+            raise ValueError('{} has unsupported snapshot version {}'.format(
+                path, version))
+        # A truncated or corrupted file would otherwise only fail when one
+        # of its nodes is first read.
+        if self._node_count == 0 or \
+                self._nodes_offset < _HEADER.size or \
+                self._nodes_offset + self._node_count * _NODE.size > \
+                self._sizes_offset or \
+                self._sizes_offset + self._node_count * _SIZE.size > \
+                self._strings_offset or \
+                self._strings_offset + separator_offset + separator_length > \
+                len(self._map):
+            raise ValueError('{} is truncated or corrupted'.format(path))
+        self.separator = self._string(separator_offset, separator_length)
+
+    def _string(self, offset, length):
+        """Return the string of <length> bytes at <offset> in the string pool.
+
+        Raise ValueError if the string pool does not contain those bytes.
+
+        @type self: _SnapshotFile
+        @type offset: int
+        @type length: int
+        @rtype: str
+        """
+        start = self._strings_offset + offset
+        if start + length > len(self._map):
+            raise ValueError('{} is truncated or corrupted'.format(self._path))
+        return self._map[start:start + length].decode('utf-8',
+                                                      'surrogateescape')
+
+    def node(self, index):
+        """Return the name, data size, first child index and child count of
+        the node at <index>.
+
+        Raise ValueError if the node's record is corrupted: its children
+        must come after it and be in the file, and its name must be in the
+        string pool.
+
+        @type self: _SnapshotFile
+        @type index: int
+        @rtype: (str | None, int, int, int)
+        """
+        name_offset, name_length, first_child, child_count = \
+            _NODE.unpack_from(self._map, self._nodes_offset +
+                              index * _NODE.size)
+        # Children come after their parent in breadth-first order, which
+        # also rules out cycles.
+        if child_count != 0 and (first_child <= index or
+                                 first_child + child_count >
+                                 self._node_count):
+            raise ValueError('{} is truncated or corrupted'.format(self._path))
+        data_size = _SIZE.unpack_from(self._map, self._sizes_offset +
+                                      index * _SIZE.size)[0]
+        if name_length == _NO_NAME:
+            name = None
+        else:
+            name = self._string(name_offset, name_length)
+        return name, data_size, first_child, child_count
+
+    def __len__(self):
+        """Return the number of nodes in this snapshot.
+
+        @type self: _SnapshotFile
+        @rtype: int
+        """
+        return self._node_count
+
+
+class SnapshotTree(AbstractTree):
+    """A tree loaded from a snapshot file.
+
+    The subtrees of a SnapshotTree are only read from the file the first time
+    they are accessed. Changes made to the tree (e.g., by remove_leaf) only
+    affect the loaded nodes, and are never written back to the file.
+
+    === Private Attributes ===
+    @type _snapshot: _SnapshotFile
+        The file this tree was loaded from.
+    @type _first_child: int
+        The index in the snapshot of this tree's first subtree.
+    @type _child_count: int
+        The number of subtrees this tree has in the snapshot.
+    @type _loaded_subtrees: list[SnapshotTree] | None
+        The subtrees of this tree, or None if they have not been loaded yet.
+    """
+    def __init__(self, snapshot, index, parent=None):
+        """Initialize the node at <index> in <snapshot>.
+
+        @type self: SnapshotTree
+        @type snapshot: _SnapshotFile
+        @type index: int
+        @type parent: SnapshotTree | None
+        @rtype: None
+        """
+        name, data_size, first_child, child_count = snapshot.node(index)
+        self._snapshot = snapshot
+        self._first_child = first_child
+        self._child_count = child_count
+        AbstractTree.__init__(self, name, [], data_size)
+        if child_count != 0:
+            self._loaded_subtrees = None
+        self._parent_tree = parent
+
+    @property
+    def _subtrees(self):
+        """The subtrees of this tree, loaded from the snapshot on first use.
+
+        @type self: SnapshotTree
+        @rtype: list[SnapshotTree]
+        """
+        if self._loaded_subtrees is None:
+            self._loaded_subtrees = [
+                SnapshotTree(self._snapshot, index, self)
+                for index in range(self._first_child,
+                                   self._first_child + self._child_count)]
+        return self._loaded_subtrees
+
+    @_subtrees.setter
+    def _subtrees(self, subtrees):
+        """Replace the subtrees of this tree.
+
+        @type self: SnapshotTree
+        @type subtrees: list[SnapshotTree]
+        @rtype: None
+        """
+        self._loaded_subtrees = subtrees
+
+    def get_separator(self):
+        """Return the string used to separate nodes in the string
+        representation of a path from the tree root to a leaf.
+
+        This is the separator of the tree that the snapshot was saved from.
+
+        @type self: SnapshotTree
+        @rtype: str
+        """
+        return self._snapshot.separator
+
+    def get_extension(self):
+        """Return the extension of the name of this tree's root, in lower
+        case and including the leading '.', or '' if it does not have one.
+
+        This matches FileSystemTree.get_extension, so the extensions of the
+        files in a saved file system tree are kept.
+
+        @type self: SnapshotTree
+        @rtype: str
+        """
+        if self._root is None:
+            return ''
+        return os.path.splitext(self._root)[1].lower()
@@ -12,8 +12,21 @@ concrete implementation of a subclass to represent files and folders on your
 computer's file system.
 """
 import os
-from random import randint
+import sys
 import math
+import heapq
+
+from colour_schemes import COLOUR_SCHEMES
+from scanner import scan, DIRECTORY_START, FILE
+
+
+# The number of largest leaves and subtrees cached for each subtree.
+# Queries for more than this many are answered by traversing the tree.
+STATS_TOP_K = 16
+
+# The number of scanned entries between calls to a FileSystemTree's progress
+# function.
+PROGRESS_ENTRIES = 4096
 
 
 class AbstractTree:
@@ -21,16 +34,19 @@ class AbstractTree:
 
     This is an abstract class that should not be instantiated directly.
 
-    You may NOT add any attributes, public or private, to this class.
-    However, part of this assignment will involve you adding and implementing
-    new public *methods* for this interface.
-
     === Public Attributes ===
     @type data_size: int
         The total size of all leaves of this tree.
     @type colour: (int, int, int)
         The RGB colour value of the root of this tree.
         Note: only the colours of leaves will influence what the user sees.
+        The colour is computed by the colour scheme the first time it is
+        used, and can also be assigned directly.
+    @type colour_scheme: str
+        The name of the colour scheme (a key of
+        colour_schemes.COLOUR_SCHEMES) used to compute colours. This is a
+        class attribute; set AbstractTree.colour_scheme to change the
+        scheme of every tree.
 
     === Private Attributes ===
     @type _root: obj | None
@@ -40,6 +56,20 @@ class AbstractTree:
     @type _parent_tree: AbstractTree | None
         The parent tree of this tree; i.e., the tree that contains this tree
         as a subtree, or None if this tree is not part of a larger tree.
+    @type _colour: (int, int, int) | None
+        The colour of this tree, or None if it has not been computed yet.
+    @type _stats: (list[AbstractTree], list[AbstractTree], dict[str, int]) |
+                  None
+        A summary of this tree: its STATS_TOP_K largest non-empty leaves, its
+        STATS_TOP_K largest proper subtrees that are not leaves (both largest
+        first), and the total data_size of its leaves with each extension.
+        None if the summary has not been computed since this tree last
+        changed, and always None for a leaf, whose summary is folded into
+        its parent's instead.
+    @type _child_prefix: str | None
+        The text shared by the paths of all subtrees of this tree, i.e. the
+        path to this tree followed by the separator, or None if it has not
+        been computed yet. It is interned, so that it is stored only once.
 
     === Representation Invariants ===
     - data_size >= 0
@@ -54,7 +84,11 @@ class AbstractTree:
       a bit easier).
 
     - if _parent_tree is not empty, then self is in _parent_tree._subtrees
+    - If _stats is None and _subtrees is not empty, then _parent_tree is
+      None or _parent_tree._stats is None.
     """
+    colour_scheme = 'path'
+
     def __init__(self, root, subtrees, data_size=0):
         """Initialize a new AbstractTree.
 
@@ -66,7 +100,7 @@ class AbstractTree:
 
         This method sets the _parent_tree attribute for each subtree to self.
 
-        A random colour is chosen for this tree.
+        This tree's colour is not computed until it is needed.
 
         Precondition: if <root> is None, then <subtrees> is empty.
 
@@ -81,12 +115,51 @@ class AbstractTree:
         self._parent_tree = None
         for subtree in self._subtrees:
             subtree._parent_tree = self
-        self.colour = (randint(0, 255), randint(0, 255), randint(0, 255))
+        self._colour = None
+        self._stats = None
+        self._child_prefix = None
         self.data_size = data_size
         if len(self._subtrees) != 0 and data_size == 0:
             for subtree in self._subtrees:
                 self.data_size += subtree.data_size
 
+    @property
+    def colour(self):
+        """The RGB colour value of the root of this tree, computed by the
+        colour scheme the first time it is used.
+
+        @type self: AbstractTree
+        @rtype: (int, int, int)
+
+        >>> from benchmark import SyntheticTree
+        >>> SyntheticTree.colour_scheme = 'size'
+        >>> leaf = SyntheticTree('a', [], 1000)
+        >>> t = SyntheticTree('t', [leaf, SyntheticTree('b', [], 10)])
+        >>> leaf.colour
+        (36, 167, 242)
+
+        The cached colour is recomputed after the leaf's size changes:
+
+        >>> for _ in range(5):
+        ...     _ = t.change_leaf_size(leaf, True)
+        >>> leaf.data_size, leaf.colour
+        (1050, (36, 180, 242))
+        >>> del SyntheticTree.colour_scheme
+        """
+        if self._colour is None:
+            self._colour = COLOUR_SCHEMES[self.colour_scheme](self)
+        return self._colour
+
+    @colour.setter
+    def colour(self, colour):
+        """Set the RGB colour value of the root of this tree.
+
+        @type self: AbstractTree
+        @type colour: (int, int, int)
+        @rtype: None
+        """
+        self._colour = colour
+
     def is_empty(self):
         """Return True if this tree is empty.
 
@@ -125,31 +198,96 @@ class AbstractTree:
             return [(rect, self.colour)]
         else:
             new_rect = []
-            current_space = 0
-            subtree_count = 0
-            for subtree in self._subtrees:
-                if rect[2] > rect[3]:  # --> Vertical Rectangles
-                    width = int((subtree.data_size / self.data_size) * rect[2])
-                    x = int(rect[0] + current_space)
-                    height = int(rect[3])
-                    y = int(rect[1])
-                    width = self._extend_height(False, subtree_count, rect,
-                                                current_space, width)
-                    new_rect += subtree.generate_treemap((x, y, width, height))
-                    current_space += width
-                    subtree_count += 1
-                else:  # rect[2] <= rect[3] --> Horizontal Rectangles
-                    height = int((subtree.data_size / self.data_size) * rect[3])
-                    y = int(rect[1] + current_space)
-                    width = int(rect[2])
-                    x = int(rect[0])
-                    height = self._extend_height(True, subtree_count, rect,
-                                                 current_space, height)
-                    new_rect += subtree.generate_treemap((x, y, width, height))
-                    current_space += height
-                    subtree_count += 1
+            for subtree, subtree_rect in self._subtree_rectangles(rect):
+                new_rect += subtree.generate_treemap(subtree_rect)
             return new_rect
 
+    def _subtree_rectangles(self, rect):
+        """ Returns the rectangle that the treemap algorithm gives to each
+        subtree of this tree, when this tree is given <rect>.
+
+        Precondition: self.data_size > 0
+
+        @type self: AbstractTree
+        @type rect: (int, int, int, int)
+            Input is in the pygame format: (x, y, width, height)
+        @rtype: list[(AbstractTree, (int, int, int, int))]
+        """
+        subtree_rects = []
+        current_space = 0
+        subtree_count = 0
+        for subtree in self._subtrees:
+            if rect[2] > rect[3]:  # --> Vertical Rectangles
+                width = int((subtree.data_size / self.data_size) * rect[2])
+                x = int(rect[0] + current_space)
+                height = int(rect[3])
+                y = int(rect[1])
+                width = self._extend_height(False, subtree_count, rect,
+                                            current_space, width)
+                subtree_rects.append((subtree, (x, y, width, height)))
+                current_space += width
+                subtree_count += 1
+            else:  # rect[2] <= rect[3] --> Horizontal Rectangles
+                height = int((subtree.data_size / self.data_size) * rect[3])
+                y = int(rect[1] + current_space)
+                width = int(rect[2])
+                x = int(rect[0])
+                height = self._extend_height(True, subtree_count, rect,
+                                             current_space, height)
+                subtree_rects.append((subtree, (x, y, width, height)))
+                current_space += height
+                subtree_count += 1
+        return subtree_rects
+
+    def get_leaf_rectangles(self, leaves, rect):
+        """ Returns the rectangles that generate_treemap(rect) gives to the
+        leaves in <leaves> that are non-empty leaves of this tree.
+
+        Leaves whose rectangle has no area are left out, since nothing is
+        drawn for them. The treemap is only laid out for the subtrees that
+        contain one of <leaves>, and not below any subtree whose rectangle has
+        no area, so this is at most as slow as generate_treemap, and much
+        faster when <leaves> are few or small.
+
+        @type self: AbstractTree
+        @type leaves: list[AbstractTree]
+        @type rect: (int, int, int, int)
+            Input is in the pygame format: (x, y, width, height)
+        @rtype: list[(int, int, int, int)]
+
+        >>> from benchmark import SyntheticTree
+        >>> a = SyntheticTree('a', [], 30)
+        >>> b = SyntheticTree('b', [], 10)
+        >>> c = SyntheticTree('c', [], 60)
+        >>> t = SyntheticTree('t', [SyntheticTree('d', [a, b]), c])
+        >>> [rect for rect, colour in t.generate_treemap((0, 0, 100, 50))]
+        [(0, 0, 40, 37), (0, 37, 40, 13), (40, 0, 60, 50)]
+        >>> t.get_leaf_rectangles([c, b, SyntheticTree('x', [], 1)],
+        ...                       (0, 0, 100, 50))
+        [(40, 0, 60, 50), (0, 37, 40, 13)]
+        """
+        # The ids of <leaves> and of all of their ancestors.
+        wanted = set()
+        for leaf in leaves:
+            while leaf is not None and id(leaf) not in wanted:
+                wanted.add(id(leaf))
+                leaf = leaf._parent_tree
+        rects = []
+        if id(self) not in wanted:
+            return rects
+        stack = [(self, rect)]
+        while stack:
+            tree, rect = stack.pop()
+            if tree.data_size == 0 or rect[2] <= 0 or rect[3] <= 0:
+                continue
+            elif len(tree._subtrees) == 0:
+                rects.append(rect)
+            else:
+                for subtree, subtree_rect in tree._subtree_rectangles(rect):
+                    if id(subtree) in wanted:
+                        stack.append((subtree, subtree_rect))
+        return rects
+
     def _extend_height(self, height_or_width, subtree_count, rect,
                        current_space, length):
         """ Returns the height of the Tree.  Extends the height in some
@@ -188,6 +326,192 @@ class AbstractTree:
         """
         raise NotImplementedError
 
+    def get_extension(self):
+        """Return the type of item that the root of this tree represents,
+        e.g. a file extension, or '' if it does not have one.
+
+        Used by the 'extension' colour scheme. This should be overridden by
+        AbstractTree subclasses whose items have types.
+
+        @type self: AbstractTree
+        @rtype: str
+        """
+        return ''
+
+    def largest_leaves(self, k=10):
+        """Return the <k> largest non-empty leaves of this tree, largest
+        first.
+
+        @type self: AbstractTree
+        @type k: int
+        @rtype: list[AbstractTree]
+
+        >>> a = FileSystemTree._from_scan('a.txt', [], 3000)
+        >>> b = FileSystemTree._from_scan('b.py', [], 1000)
+        >>> c = FileSystemTree._from_scan('c.txt', [], 2000)
+        >>> t = FileSystemTree._from_scan('t', [
+        ...     FileSystemTree._from_scan('d', [a, b], 4000), c], 6000)
+        >>> [leaf._root for leaf in t.largest_leaves(2)]
+        ['a.txt', 'c.txt']
+        >>> [leaf._root for leaf in t.largest_leaves(STATS_TOP_K + 1)]
+        ['a.txt', 'c.txt', 'b.py']
+
+        The summary is recomputed after a leaf's size changes:
+
+        >>> for _ in range(100):
+        ...     _ = t.change_leaf_size(b, True)
+        >>> b.data_size, t.data_size
+        (2620, 7620)
+        >>> [leaf._root for leaf in t.largest_leaves(2)]
+        ['a.txt', 'b.py']
+        """
+        if k <= STATS_TOP_K:
+            return self._get_stats()[0][:k]
+        return heapq.nlargest(k, self._leaves(),
+                              key=lambda tree: tree.data_size)
+
+    def largest_subtrees(self, k=10):
+        """Return the <k> largest proper subtrees of this tree that are not
+        leaves (e.g., the largest folders in a FileSystemTree), largest first.
+
+        @type self: AbstractTree
+        @type k: int
+        @rtype: list[AbstractTree]
+
+        >>> e = FileSystemTree._from_scan('e', [
+        ...     FileSystemTree._from_scan('a.txt', [], 30)], 30)
+        >>> f = FileSystemTree._from_scan('f', [
+        ...     FileSystemTree._from_scan('b.txt', [], 15),
+        ...     FileSystemTree._from_scan('c.txt', [], 10)], 25)
+        >>> t = FileSystemTree._from_scan('t', [
+        ...     FileSystemTree._from_scan('d', [
+        ...         e, FileSystemTree._from_scan('g.txt', [], 5)], 35), f], 60)
+        >>> [subtree._root for subtree in t.largest_subtrees()]
+        ['d', 'e', 'f']
+
+        The summary is recomputed after a leaf is removed. Here the only
+        leaf in e is removed, so e becomes a leaf itself:
+
+        >>> treemap = t.generate_treemap((0, 0, 100, 100))
+        >>> _ = t.remove_leaf((0, 0), treemap)
+        >>> [(subtree._root, subtree.data_size)
+        ...  for subtree in t.largest_subtrees()]
+        [('f', 25), ('d', 5)]
+        """
+        if k <= STATS_TOP_K:
+            return self._get_stats()[1][:k]
+        return heapq.nlargest(k, self._internal_subtrees(),
+                              key=lambda tree: tree.data_size)
+
+    def extension_sizes(self):
+        """Return the total data_size of the leaves of this tree with each
+        extension (as returned by get_extension).
+
+        @type self: AbstractTree
+        @rtype: dict[str, int]
+
+        >>> b = FileSystemTree._from_scan('b.py', [], 10)
+        >>> t = FileSystemTree._from_scan('t', [
+        ...     FileSystemTree._from_scan('d', [
+        ...         FileSystemTree._from_scan('a.TXT', [], 30), b], 40),
+        ...     FileSystemTree._from_scan('c.txt', [], 20),
+        ...     FileSystemTree._from_scan('Makefile', [], 5)], 65)
+        >>> sorted(t.extension_sizes().items())
+        [('', 5), ('.py', 10), ('.txt', 50)]
+        >>> treemap = t.generate_treemap((0, 0, 100, 100))
+        >>> _ = t.remove_leaf((0, 99), treemap)
+        >>> sorted(t.extension_sizes().items())
+        [('.py', 10), ('.txt', 50)]
+        """
+        return dict(self._get_stats()[2])
+
+    def _get_stats(self):
+        """Return the summary of this tree described by _stats, computing
+        it if necessary.
+
+        Only the subtrees that have changed since their summary was last
+        computed are visited.
+
+        @type self: AbstractTree
+        @rtype: (list[AbstractTree], list[AbstractTree], dict[str, int])
+        """
+        if self._stats is not None:
+            return self._stats
+        if len(self._subtrees) == 0:
+            # Not stored: a leaf's summary is folded into its parent's.
+            if self.is_empty() or self.data_size == 0:
+                return [], [], {}
+            return [self], [], {self.get_extension(): self.data_size}
+        leaves = []
+        subtrees = []
+        extension_sizes = {}
+        for subtree in self._subtrees:
+            if len(subtree._subtrees) == 0:
+                if not subtree.is_empty() and subtree.data_size != 0:
+                    leaves.append(subtree)
+                    extension = subtree.get_extension()
+                    extension_sizes[extension] = \
+                        extension_sizes.get(extension, 0) + subtree.data_size
+                continue
+            subtree_leaves, subtree_subtrees, subtree_extension_sizes = \
+                subtree._get_stats()
+            leaves += subtree_leaves
+            subtrees += subtree_subtrees
+            subtrees.append(subtree)
+            for extension, size in subtree_extension_sizes.items():
+                extension_sizes[extension] = \
+                    extension_sizes.get(extension, 0) + size
+        self._stats = (
+            heapq.nlargest(STATS_TOP_K, leaves,
+                           key=lambda tree: tree.data_size),
+            heapq.nlargest(STATS_TOP_K, subtrees,
+                           key=lambda tree: tree.data_size),
+            extension_sizes)
+        return self._stats
+
+    def _invalidate_stats(self):
+        """Discard the summaries of this tree and every tree that contains
+        it, after this tree has changed.
+
+        Leaves have no summary of their own, so a leaf's parent should be
+        invalidated when the leaf changes.
+
+        @type self: AbstractTree
+        @rtype: None
+        """
+        tree = self
+        while tree is not None and tree._stats is not None:
+            tree._stats = None
+            tree = tree._parent_tree
+
+    def _leaves(self):
+        """Return an iterator over the non-empty leaves of this tree.
+
+        @type self: AbstractTree
+        @rtype: iterator[AbstractTree]
+        """
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if len(tree._subtrees) != 0:
+                stack.extend(tree._subtrees)
+            elif not tree.is_empty() and tree.data_size != 0:
+                yield tree
+
+    def _internal_subtrees(self):
+        """Return an iterator over the proper subtrees of this tree that are
+        not leaves.
+
+        @type self: AbstractTree
+        @rtype: iterator[AbstractTree]
+        """
+        stack = list(self._subtrees)
+        while stack:
+            tree = stack.pop()
+            if len(tree._subtrees) != 0:
+                stack.extend(tree._subtrees)
+                yield tree
+
     def get_text(self, location, treemap):
         """ Returns the text to display when a user clicks a certain rectangle
         on the pygame screen, as well as the AbstractTree that was clicked.
@@ -215,8 +539,7 @@ class AbstractTree:
         tree_from_number = self._get_tree_from_number(tree_number)
         assert tree_from_number is not None, 'tree_from_number is None!'
         tree_size = tree_from_number.data_size
-        return (tree_from_number.get_text_from_tree() + tree_from_number._root
-                + ' (' + str(tree_size) + ')',
+        return (tree_from_number.get_path() + ' (' + str(tree_size) + ')',
                 tree_from_number)
 
     def get_text_from_tree(self):
@@ -233,10 +556,56 @@ class AbstractTree:
         if self._parent_tree is None:
             return ''
         else:
-            tree_path = self._parent_tree._root
-            tree_path = self._parent_tree.get_text_from_tree() + tree_path \
-                + self.get_separator()
-            return tree_path
+            return self._parent_tree._get_child_prefix()
+
+    def _get_child_prefix(self):
+        """ Returns the text shared by the paths of all subtrees of this tree,
+        computing and caching it if necessary.
+
+        The text is built from the cached prefix of the parent tree, so each
+        prefix is only computed once, however many leaves share it.
+
+        @type self: AbstractTree
+        @rtype: str
+        """
+        if self._child_prefix is None:
+            self._child_prefix = sys.intern(
+                self.get_text_from_tree() + str(self._root) +
+                self.get_separator())
+        return self._child_prefix
+
+    def get_path(self):
+        """ Returns the path from the root of the whole tree to this tree,
+        with items separated by get_separator().
+
+        @type self: AbstractTree
+        @rtype: str
+
+        The cached prefixes give the same text as building it recursively
+        from the root each time:
+
+        >>> from benchmark import build_synthetic_tree
+        >>> def recursive_text(tree):
+        ...     if tree._parent_tree is None:
+        ...         return ''
+        ...     return (recursive_text(tree._parent_tree) +
+        ...             str(tree._parent_tree._root) + tree.get_separator())
+        >>> t = build_synthetic_tree(300, 3, 7)
+        >>> nodes = [t] + list(t._internal_subtrees()) + list(t._leaves())
+        >>> all(node.get_text_from_tree() == recursive_text(node)
+        ...     for node in nodes)
+        True
+        >>> leaf = t._subtrees[2]._subtrees[0]._subtrees[4]
+        >>> leaf.get_path()
+        'root/root_2/root_2_0/root_2_0_4.dat'
+
+        Leaves with the same parent share one prefix string:
+
+        >>> sibling = t._subtrees[2]._subtrees[0]._subtrees[5]
+        >>> leaf.get_text_from_tree() is sibling.get_text_from_tree()
+        True
+        """
+        return self.get_text_from_tree() + str(self._root)
 
     def _get_tree_from_number(self, tree_number):
         """ Returns a tree based on the position of the tree in the rectangle
@@ -297,7 +666,7 @@ class AbstractTree:
             if len(subtree._subtrees) == 0:
                 count += 1
             else:
-                count += subtree._number_of_leaves(count)
+                count += subtree._number_of_leaves()
         assert count is not None, '_number_of_leaves returns None.'
         return count
 
@@ -358,6 +727,8 @@ class AbstractTree:
             if subtree == deleted_leaf:
                 subtree._change_data_sizes(subtree.data_size, False)
                 self._subtrees.remove(subtree)
+                subtree._parent_tree = None
+                self._invalidate_stats()
             else:
                 subtree._delete_leaf(deleted_leaf)
 
@@ -397,6 +768,9 @@ class AbstractTree:
         for index, subtree in enumerate(self._subtrees):
             if subtree == selected_leaf:
                 changed_size = int(0.01 * subtree.data_size)
+                # The 'size' colour scheme depends on the data size.
+                subtree._colour = None
+                self._invalidate_stats()
                 if up_or_down:
                     self._subtrees[index].data_size += changed_size
                     subtree._change_data_sizes(changed_size, True)
@@ -418,15 +792,30 @@ class FileSystemTree(AbstractTree):
     path. E.g., store 'assignments', not '/Users/David/csc148/assignments'
 
     The data_size attribute for regular files as simply the size of the file,
-    as reported by os.path.getsize.
+    as reported by os.stat. The data_size of a folder is the total size of
+    the files in it.
     """
-    def __init__(self, path):
+    def __init__(self, path, search_index=None, options=None, progress=None):
         """Store the file tree structure contained in the given file or folder.
 
+        If <search_index> is given, every file is added to it as it is
+        scanned. <options> controls which files and folders are scanned; see
+        scanner.ScanOptions.
+
+        If <progress> is given, it is called every PROGRESS_ENTRIES scanned
+        entries with the folders that are being scanned, outermost first,
+        and the number of entries scanned so far. Each folder is given as its
+        name and a list of the subtrees that have been completed in it; the
+        function must not modify these.
+
         Precondition: <path> is a valid path for this computer.
 
         @type self: FileSystemTree
         @type path: str
+        @type search_index: SearchIndex | None
+        @type options: ScanOptions | None
+        @type progress: ((list[(str, list[FileSystemTree])], int) -> object) |
+                        None
         @rtype: None
 
         >>> t = FileSystemTree('C:\\Users\\HP\\Documents\\Year '\
@@ -434,15 +823,46 @@ class FileSystemTree(AbstractTree):
         >>> t._root
         B
         """
-        root = os.path.basename(path)
-        subtrees = []
-        data_size = os.path.getsize(path)
-        if os.path.isdir(path):
-            for filename in os.listdir(path):
-                subitem = os.path.join(path, filename)
-                new_tree = FileSystemTree(subitem)
-                subtrees.append(new_tree)
-        super().__init__(root, subtrees, data_size)
+        # The name of each folder that is being scanned, and the subtrees
+        # found in it so far.
+        folders = []
+        for count, entry in enumerate(scan(path, options), 1):
+            if progress is not None and count % PROGRESS_ENTRIES == 0:
+                progress(folders, count)
+            if entry.kind == DIRECTORY_START:
+                folders.append((entry.name, []))
+                continue
+            if entry.kind == FILE:
+                folder_subtrees = []
+            else:  # DIRECTORY_END
+                folder_subtrees = folders.pop()[1]
+            if entry.depth == 0:
+                super().__init__(entry.name, folder_subtrees, entry.size)
+                new_tree = self
+            else:
+                new_tree = FileSystemTree._from_scan(entry.name,
+                                                     folder_subtrees,
+                                                     entry.size)
+                folders[-1][1].append(new_tree)
+            if search_index is not None and entry.kind == FILE:
+                search_index.add(new_tree)
+        if search_index is not None:
+            search_index.tree = self
+
+    @classmethod
+    def _from_scan(cls, name, subtrees, data_size):
+        """Return a new FileSystemTree for a file or folder that has already
+        been scanned, without scanning it again.
+
+        @type cls: type
+        @type name: str
+        @type subtrees: list[FileSystemTree]
+        @type data_size: int
+        @rtype: FileSystemTree
+        """
+        tree = cls.__new__(cls)
+        AbstractTree.__init__(tree, name, subtrees, data_size)
+        return tree
 
     def get_separator(self):
         """Return the string used to separate nodes in the string
@@ -460,6 +880,16 @@ class FileSystemTree(AbstractTree):
         """
         return '/'
 
+    def get_extension(self):
+        """Return the extension of the file that the root of this tree
+        represents, in lower case and including the leading '.', or '' if
+        it does not have one.
+
+        @type self: FileSystemTree
+        @rtype: str
+        """
+        return os.path.splitext(self._root)[1].lower()
+
 
 if __name__ == '__main__':
     import python_ta
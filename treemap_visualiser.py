@@ -13,8 +13,15 @@ and detecting user events like mouse clicks and key presses and responding
 to them.
 """
 import pygame
-from tree_data import FileSystemTree
+from tree_data import AbstractTree, FileSystemTree
+from colour_schemes import COLOUR_SCHEMES
 from population import PopulationTree
+from profiling import PROFILER
+from search import SearchIndex
+from scanner import ScanOptions
+from background_scan import BackgroundScan
+from snapshot import save_snapshot, load_snapshot
+import argparse
 import os
 import sys
 
@@ -30,10 +37,16 @@ TREEMAP_HEIGHT = HEIGHT - FONT_HEIGHT  # The height of the treemap display.
 FONT_FAMILY = 'Consolas'
 
 
-def run_visualisation(tree):
+def run_visualisation(tree, search_index=None, scan=None):
     """Display an interactive graphical display of the given tree's treemap.
 
+    If <scan> is given, <tree> is replaced by the trees that it publishes as
+    it runs; see event_loop. If <search_index> is not given, the leaves of
+    <tree> are indexed the first time they are searched.
+
     @type tree: AbstractTree
+    @type search_index: SearchIndex | None
+    @type scan: BackgroundScan | None
     @rtype: None
     """
     # Setup pygame
@@ -44,36 +57,71 @@ def run_visualisation(tree):
     render_display(screen, tree, '')
 
     # Start an event loop to respond to events.
-    event_loop(screen, tree)
+    event_loop(screen, tree, search_index, scan)
+
+    if PROFILER.enabled:
+        print(PROFILER.report())
 
 
-def render_display(screen, tree, text):
+def render_display(screen, tree, text, highlighted=()):
     """Render a treemap and text display to the given screen.
 
     Use the constants TREEMAP_HEIGHT and FONT_HEIGHT to divide the
     screen vertically into the treemap and text comments.
 
+    Each rectangle in <highlighted> is outlined; see _highlight_rectangles.
+
+    Return the treemap that was drawn, for use in hit-testing.
+
     @type screen: pygame.Surface
     @type tree: AbstractTree
     @type text: str
         The text to render.
-    @rtype: None
+    @type highlighted: list[(int, int, int, int)]
+    @rtype: list[((int, int, int, int), (int, int, int))]
     """
-    # First, clear the screen
-    pygame.draw.rect(screen, pygame.color.THECOLORS['black'],
-                     (0, 0, WIDTH, HEIGHT))
-    rect_list = tree.generate_treemap((0, 0, WIDTH, TREEMAP_HEIGHT))
-    for rect in rect_list:
-        if rect[0][2] == 0 or rect[0][3] == 0:
-            rect_list.remove(rect)
+    with PROFILER.phase('frame'):
+        # First, clear the screen
+        pygame.draw.rect(screen, pygame.color.THECOLORS['black'],
+                         (0, 0, WIDTH, HEIGHT))
+        with PROFILER.phase('layout'):
+            rect_list = tree.generate_treemap((0, 0, WIDTH, TREEMAP_HEIGHT))
 
-    for element in rect_list:
-        pygame.draw.rect(screen, element[1], element[0])
+        with PROFILER.phase('draw'):
+            drawn = 0
+            for element in rect_list:
+                if element[0][2] != 0 and element[0][3] != 0:
+                    pygame.draw.rect(screen, element[1], element[0])
+                    drawn += 1
+        PROFILER.set_value('rectangles', drawn)
 
-    _render_text(screen, text)
+        for rect in highlighted:
+            pygame.draw.rect(screen, pygame.color.THECOLORS['white'], rect, 2)
 
-    # This must be called *after* all other pygame functions have run.
-    pygame.display.flip()
+        _render_text(screen, text)
+
+        # This must be called *after* all other pygame functions have run.
+        pygame.display.flip()
+    return rect_list
+
+
+def _highlight_rectangles(tree, leaves):
+    """Return the rectangles to outline for <leaves> in the treemap of
+    <tree>.
+
+    These only change when the tree does, so they are computed once and
+    passed to each call to render_display, rather than laid out again for
+    every frame.
+
+    @type tree: AbstractTree
+    @type leaves: list[AbstractTree]
+    @rtype: list[(int, int, int, int)]
+    """
+    if len(leaves) == 0:
+        return []
+    with PROFILER.phase('highlight'):
+        return tree.get_leaf_rectangles(leaves,
+                                        (0, 0, WIDTH, TREEMAP_HEIGHT))
 
 
 def _render_text(screen, text):
@@ -92,8 +140,15 @@ def _render_text(screen, text):
     text_pos = (0, HEIGHT - FONT_HEIGHT + 4)
     screen.blit(text_surface, text_pos)
 
+    # The performance display goes at the right end of the text bar.
+    if PROFILER.hud:
+        hud_surface = font.render(PROFILER.hud_text(), 1,
+                                  pygame.color.THECOLORS['yellow'])
+        hud_pos = (WIDTH - hud_surface.get_width(), HEIGHT - FONT_HEIGHT + 4)
+        screen.blit(hud_surface, hud_pos)
+
 
-def event_loop(screen, tree):
+def event_loop(screen, tree, search_index, scan=None):
     """Respond to events (mouse clicks, key presses) and update the display.
 
     Note that the event loop is an *infinite loop*: it continually waits for
@@ -101,76 +156,268 @@ def event_loop(screen, tree):
     of the visualisation or the tree itself, updating the display if necessary.
     This loop ends when the user closes the window.
 
+    Pressing '/' starts a search: the query is typed into the text bar, and
+    pressing Enter outlines the leaves that match it (see search.py for the
+    query syntax). Pressing Escape cancels the search and the outlines.
+
+    If <scan> is given, the display is redrawn with each tree it publishes,
+    and <search_index> is replaced by the scan's index once it finishes.
+    Until then, leaves can be selected, but the tree cannot be changed or
+    searched. If the scan fails, or <search_index> is None, the leaves of the
+    tree being displayed are indexed the first time they are searched.
+
     @type screen: pygame.Surface
     @type tree: AbstractTree
+    @type search_index: SearchIndex | None
+    @type scan: BackgroundScan | None
     @rtype: None
     """
     selected_leaf = None
     selected_leaf_text = ''
-    treemap = tree.generate_treemap((0, 0, WIDTH, HEIGHT))
+    treemap = tree.generate_treemap((0, 0, WIDTH, TREEMAP_HEIGHT))
+    query = None  # The search being typed, or None if not searching.
+    highlighted = []  # The leaves that matched the last search.
+    highlight_rects = []  # Their rectangles, from _highlight_rectangles.
+    scan_version = 0
 
     while True:
+        if scan is not None:
+            # Check whether the scan has finished *before* polling, so that
+            # the complete tree is not missed.
+            finished = scan.done
+            new_tree, scan_version = scan.poll(scan_version)
+            if new_tree is not None:
+                tree = new_tree
+                selected_leaf = None
+            if finished:
+                if scan.error is not None:
+                    text = 'Scan failed: {}'.format(scan.error)
+                    # The scan's index may not match the tree being shown.
+                    search_index = None
+                else:
+                    text = ''
+                    if scan.snapshot_error is not None:
+                        text = 'Could not save snapshot: {}'.format(
+                            scan.snapshot_error)
+                    search_index = scan.search_index
+                scan = None
+                treemap = render_display(screen, tree, text)
+            elif new_tree is not None:
+                treemap = render_display(
+                    screen, tree,
+                    'Scanning... {} items'.format(scan.entries))
+
         # Wait for an event
         event = pygame.event.poll()
         if event.type == pygame.QUIT:
             return
-
-        if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+        elif event.type == pygame.NOEVENT:
+            # Sleep briefly instead of spinning while there is nothing to do.
+            pygame.time.wait(10)
+            continue
+        scanning = scan is not None
+
+        if query is not None and event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_ESCAPE:
+                query = None
+                highlighted = []
+                highlight_rects = []
+                treemap = render_display(screen, tree, '')
+                continue
+            elif event.key == pygame.K_RETURN:
+                if search_index is None:
+                    with PROFILER.phase('index'):
+                        search_index = SearchIndex.from_tree(tree)
+                try:
+                    with PROFILER.phase('search'):
+                        highlighted = search_index.search(query)
+                    text = '{} matches for {}'.format(len(highlighted), query)
+                except ValueError as error:
+                    highlighted = []
+                    text = 'Invalid search: {}'.format(error)
+                query = None
+                highlight_rects = _highlight_rectangles(tree, highlighted)
+                treemap = render_display(screen, tree, text, highlight_rects)
+                continue
+            elif event.key == pygame.K_BACKSPACE:
+                query = query[:-1]
+            else:
+                query += event.unicode
+            treemap = render_display(screen, tree, 'Search: ' + query,
+                                     highlight_rects)
+        elif query is not None and event.type == pygame.KEYUP:
+            pass  # Keys typed into the search do nothing else.
+        elif not scanning and event.type == pygame.KEYDOWN and \
+                event.unicode == '/':
+            query = ''
+            treemap = render_display(screen, tree, 'Search: ',
+                                     highlight_rects)
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
             location = event.pos
             if location[1] <= TREEMAP_HEIGHT:
-                text, selected_leaf = tree.get_text(location, treemap)
+                with PROFILER.phase('hit_test'):
+                    text, selected_leaf = tree.get_text(location, treemap)
                 selected_leaf_text = text
-                render_display(screen, tree, text)
-        elif event.type == pygame.MOUSEBUTTONUP and event.button == 3:
+                treemap = render_display(screen, tree, text,
+                                         highlight_rects)
+        elif not scanning and event.type == pygame.MOUSEBUTTONUP and \
+                event.button == 3:
             location = event.pos
             if location[1] <= TREEMAP_HEIGHT:
-                new_tree = tree.remove_leaf(location, treemap)
-                render_display(screen, new_tree, '')
-        elif selected_leaf is not None and event.type == pygame.KEYUP and \
-                event.key == pygame.K_UP:
-            new_tree = tree.change_leaf_size(selected_leaf, True)
+                with PROFILER.phase('remove_leaf'):
+                    new_tree = tree.remove_leaf(location, treemap)
+                highlight_rects = _highlight_rectangles(new_tree, highlighted)
+                treemap = render_display(screen, new_tree, '',
+                                         highlight_rects)
+        elif not scanning and selected_leaf is not None and \
+                event.type == pygame.KEYUP and event.key == pygame.K_UP:
+            with PROFILER.phase('change_leaf_size'):
+                new_tree = tree.change_leaf_size(selected_leaf, True)
             new_text = selected_leaf_text.split('(', 1)[0]
             new_text += '(' + str(selected_leaf.data_size) + ')'
-            render_display(screen, new_tree, new_text)
-        elif selected_leaf is not None and event.type == pygame.KEYUP and \
-                event.key == pygame.K_DOWN:
-            new_tree = tree.change_leaf_size(selected_leaf, False)
+            highlight_rects = _highlight_rectangles(new_tree, highlighted)
+            treemap = render_display(screen, new_tree, new_text,
+                                     highlight_rects)
+        elif not scanning and selected_leaf is not None and \
+                event.type == pygame.KEYUP and event.key == pygame.K_DOWN:
+            with PROFILER.phase('change_leaf_size'):
+                new_tree = tree.change_leaf_size(selected_leaf, False)
             new_text = selected_leaf_text.split('(', 1)[0]
             new_text += '(' + str(selected_leaf.data_size) + ')'
-            render_display(screen, new_tree, new_text)
+            highlight_rects = _highlight_rectangles(new_tree, highlighted)
+            treemap = render_display(screen, new_tree, new_text,
+                                     highlight_rects)
 
 
-def run_treemap_file_system(path):
+def run_treemap_file_system(path, options=None, snapshot_path=None):
     """Run a treemap visualisation for the given path's file structure.
 
+    <options> controls which files and folders are scanned. The path is
+    scanned in the background, and the display shows the files found so far
+    until the scan is finished. If <snapshot_path> is given, the complete
+    tree is saved there as a snapshot file; see snapshot.py.
+
     Precondition: <path> is a valid path to a file or folder.
 
     @type path: str
+    @type options: ScanOptions | None
+    @type snapshot_path: str | None
     @rtype: None
     """
-    file_tree = FileSystemTree(path)
-    run_visualisation(file_tree)
+    scan = BackgroundScan(path, options, snapshot_path)
+    scan.start()
+    # Nothing has been scanned yet, so start with an empty tree.
+    file_tree = FileSystemTree._from_scan(os.path.basename(path), [], 0)
+    run_visualisation(file_tree, scan=scan)
 
 
-def run_treemap_population():
+def run_treemap_population(snapshot_path=None):
     """Run a treemap visualisation for World Bank population data.
 
+    If <snapshot_path> is given, the tree is saved there as a snapshot file.
+
+    @type snapshot_path: str | None
     @rtype: None
     """
     pop_tree = PopulationTree(True)
+    if snapshot_path is not None:
+        _save_snapshot(pop_tree, snapshot_path)
     run_visualisation(pop_tree)
 
 
+def run_treemap_snapshot(path, snapshot_path=None):
+    """Run a treemap visualisation for the tree saved in the snapshot file
+    at <path>.
+
+    If <snapshot_path> is given, the tree is saved there as a snapshot file
+    as well. Exit the program if <path> cannot be loaded.
+
+    @type path: str
+    @type snapshot_path: str | None
+    @rtype: None
+    """
+    try:
+        tree = load_snapshot(path)
+        # Corrupted nodes are only found when they are loaded, which saving
+        # or the first layout of the treemap does.
+        if snapshot_path is not None:
+            _save_snapshot(tree, snapshot_path)
+        run_visualisation(tree)
+    except (OSError, ValueError) as error:
+        sys.exit('Could not load snapshot: {}'.format(error))
+
+
+def _save_snapshot(tree, path):
+    """Save <tree> to a snapshot file at <path>, reporting any error on
+    standard error.
+
+    @type tree: AbstractTree
+    @type path: str
+    @rtype: None
+    """
+    try:
+        with PROFILER.phase('save_snapshot'):
+            save_snapshot(tree, path)
+    except OSError as error:
+        print('Could not save snapshot: {}'.format(error), file=sys.stderr)
+
+
 if __name__ == '__main__':
     # Uncomment the following 2 lines to run PythonTA, which runs a few tests.
     # import python_ta
     # python_ta.check_all(config='pylintrc.txt')
 
-    if len(sys.argv) < 2 or sys.argv[1] not in ['population', 'filesystem']:
-        print('Usage: python {} [population|filesystem]'.format(sys.argv[0]))
-        exit(1)
-    elif sys.argv[1] == 'filesystem':
-        # Runs the file system treemap on the parent directory of your working directory.
-        run_treemap_file_system(os.path.abspath(os.path.join(os.getcwd(), os.pardir)))
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode', choices=['population', 'filesystem',
+                                         'snapshot'])
+    parser.add_argument('path', nargs='?',
+                        help='the snapshot file to display, in snapshot mode')
+    parser.add_argument('--save-snapshot', metavar='PATH',
+                        help='save the tree to a snapshot file at PATH once '
+                             'it is loaded')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the time taken by each phase on exit')
+    parser.add_argument('--hud', action='store_true',
+                        help='show frame and layout times in the text bar')
+    parser.add_argument('--colours', choices=sorted(COLOUR_SCHEMES),
+                        default=AbstractTree.colour_scheme,
+                        help='how to colour the leaves (default: %(default)s)')
+    parser.add_argument('--exclude', action='append', default=[],
+                        metavar='GLOB',
+                        help='skip files and folders whose name matches GLOB '
+                             '(may be repeated)')
+    parser.add_argument('--max-depth', type=int,
+                        help='leave out folders deeper than this')
+    parser.add_argument('--one-file-system', action='store_true',
+                        help='skip folders on other file systems')
+    parser.add_argument('--follow-symlinks', action='store_true',
+                        help='follow symbolic links')
+    parser.add_argument('--collapse-below', type=int, default=0,
+                        metavar='BYTES',
+                        help='fold files smaller than BYTES into one '
+                             "'<other>' leaf per folder")
+    parser.add_argument('--collapse-top', type=int, metavar='N',
+                        help="fold all but the N largest files in each folder "
+                             "into one '<other>' leaf")
+    args = parser.parse_args()
+    if (args.mode == 'snapshot') != (args.path is not None):
+        parser.error('a path must be given in snapshot mode, and only then')
+
+    PROFILER.enabled = PROFILER.enabled or args.profile or args.hud
+    PROFILER.hud = PROFILER.hud or args.hud
+    AbstractTree.colour_scheme = args.colours
+
+    if args.mode == 'filesystem':
+        scan_options = ScanOptions(args.exclude, args.max_depth,
+                                   args.one_file_system, args.follow_symlinks,
+                                   collapse_below=args.collapse_below,
+                                   collapse_top_n=args.collapse_top)
+        # Runs the file system treemap on the parent directory of your
+        # working directory.
+        run_treemap_file_system(
+            os.path.abspath(os.path.join(os.getcwd(), os.pardir)),
+            scan_options, args.save_snapshot)
+    elif args.mode == 'snapshot':
+        run_treemap_snapshot(args.path, args.save_snapshot)
     else:
-        run_treemap_population()
+        run_treemap_population(args.save_snapshot)